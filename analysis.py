@@ -0,0 +1,225 @@
+# coding: utf-8
+
+# Aggregates behind the insights of wrangle_act.py (Analyzing and Visualizing Data).
+#
+# The insights group the master by breed_of_dog, dog_stage or source and average retweet_count,
+# favorite_count and rating_numerator. Aggregates keeps, for every group of those columns, the number of
+# rows and the count, sum and sum of squared deviations from the mean (m2) of every value column, computed
+# column-wise in one pass over a frame. Two Aggregates merge exactly (the pairwise update of Chan et al.),
+# so a chunk, a partition or the tweets appended to the master are summarized on their own and merged
+# into the stored aggregates, and the insights are answered from the aggregates without the master.
+#
+#   aggregates = Aggregates.from_frame(twitter_archive_master)
+#   aggregates.table('breed_of_dog', min_rows=16)['rating_numerator']['mean']
+
+import numpy as np
+import pandas as pd
+
+AGGREGATE_KEYS = ['breed_of_dog', 'dog_stage', 'source']
+AGGREGATE_VALUES = ['retweet_count', 'favorite_count', 'rating_numerator']
+#stats stored per value column, the mean and the variance are derived from them
+AGGREGATE_STATS = ['count', 'sum', 'm2']
+
+
+class Aggregates:
+    def __init__(self, keys=AGGREGATE_KEYS, values=AGGREGATE_VALUES):
+        self.keys = list(keys)
+        self.values = list(values)
+        #one row per (key, group), e.g. ('dog_stage', 'pupper')
+        index = pd.MultiIndex.from_arrays([np.array([], dtype=object)] * 2, names=['key', 'group'])
+        self.rows = pd.Series(np.zeros(0, dtype=np.int64), index=index)
+        self.stats = {stat: pd.DataFrame(np.zeros((0, len(self.values)), dtype=np.int64 if stat == 'count'
+                                                  else np.float64), index=index, columns=self.values)
+                      for stat in AGGREGATE_STATS}
+
+    @classmethod
+    def from_frame(cls, df, keys=AGGREGATE_KEYS, values=AGGREGATE_VALUES):
+        return cls(keys, values).add(df)
+
+    def summarize(self, df):
+        #Aggregates of df alone. Rows with a missing key are left out of that key's groups and missing values
+        #out of the value's count, like groupby().mean().
+        rows, stats = [], {stat: [] for stat in AGGREGATE_STATS}
+        for key in self.keys:
+            codes, groups = pd.factorize(df[key])
+            keep = codes >= 0
+            codes = codes[keep]
+            size = len(groups)
+            index = pd.MultiIndex.from_arrays([np.full(size, key, dtype=object),
+                                               np.asarray(groups, dtype=object).astype(str)], names=['key', 'group'])
+            rows.append(pd.Series(np.bincount(codes, minlength=size), index=index))
+            part = {stat: {} for stat in AGGREGATE_STATS}
+            for value in self.values:
+                x = df[value].to_numpy(dtype=np.float64, na_value=np.nan)[keep]
+                valid = ~np.isnan(x)
+                group, x = codes[valid], x[valid]
+                count = np.bincount(group, minlength=size)
+                total = np.bincount(group, weights=x, minlength=size)
+                mean = total / np.maximum(count, 1)
+                part['count'][value] = count
+                part['sum'][value] = total
+                part['m2'][value] = np.bincount(group, weights=(x - mean[group]) ** 2, minlength=size)
+            for stat in AGGREGATE_STATS:
+                stats[stat].append(pd.DataFrame(part[stat], index=index, columns=self.values))
+        summary = Aggregates(self.keys, self.values)
+        if rows:
+            summary.rows = pd.concat(rows).astype(np.int64)
+            summary.stats = {stat: pd.concat(frames) for stat, frames in stats.items()}
+        return summary
+
+    def add(self, df):
+        #merge the aggregates of the rows of df, returns self
+        return self.merge(self.summarize(df))
+
+    def merge(self, other):
+        #merge another Aggregates in place, returns self
+        index = self.rows.index.union(other.rows.index)
+        self.rows = self.rows.reindex(index, fill_value=0) + other.rows.reindex(index, fill_value=0)
+        a = {stat: frame.reindex(index, fill_value=0) for stat, frame in self.stats.items()}
+        b = {stat: frame.reindex(index, fill_value=0) for stat, frame in other.stats.items()}
+        count = a['count'] + b['count']
+        #m2 of the union: both m2 plus the spread between the two means
+        with np.errstate(divide='ignore', invalid='ignore'):
+            delta = b['sum'] / b['count'] - a['sum'] / a['count']
+            spread = (delta ** 2 * a['count'] * b['count'] / count).fillna(0)
+        self.stats = {'count': count, 'sum': a['sum'] + b['sum'], 'm2': a['m2'] + b['m2'] + spread}
+        return self
+
+    def table(self, key, min_rows=0):
+        #one row per group of `key` with at least min_rows rows: the rows, and count, sum, mean and
+        #var (ddof=1 like pandas) of every value column, e.g. table('source')['retweet_count']['mean']
+        rows = self.rows.xs(key, level='key')
+        keep = (rows >= min_rows).to_numpy()
+        stats = {stat: frame.xs(key, level='key')[keep] for stat, frame in self.stats.items()}
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = stats['sum'] / stats['count']
+            var = stats['m2'] / (stats['count'] - 1)
+        columns = {('rows', 'count'): rows[keep]}
+        for value in self.values:
+            columns[(value, 'count')] = stats['count'][value]
+            columns[(value, 'sum')] = stats['sum'][value]
+            columns[(value, 'mean')] = mean[value]
+            columns[(value, 'var')] = var[value].where(stats['count'][value] > 1)
+        return pd.DataFrame(columns)
+
+    def save(self, path):
+        #one csv row per (key, group), the stats in <stat>_<value> columns
+        frame = pd.DataFrame({'rows': self.rows})
+        for stat, stats in self.stats.items():
+            for value in self.values:
+                frame[stat + '_' + value] = stats[value]
+        frame.to_csv(path, index=True)
+
+    @classmethod
+    def load(cls, path, keys=AGGREGATE_KEYS, values=AGGREGATE_VALUES):
+        #group labels are read as text, a group called 'None' or 'NaN' stays a label
+        frame = pd.read_csv(path, index_col=['key', 'group'], dtype={'key': str, 'group': str},
+                            keep_default_na=False)
+        aggregates = cls(keys, values)
+        aggregates.rows = frame['rows'].astype(np.int64)
+        aggregates.stats = {stat: frame[[stat + '_' + value for value in aggregates.values]]
+                            .set_axis(aggregates.values, axis=1)
+                            .astype(np.int64 if stat == 'count' else np.float64) for stat in AGGREGATE_STATS}
+        return aggregates
+
+
+# ## Correlation and regression
+#
+# Insight 2 correlates retweet_count with favorite_count and fits a line through them. Correlation keeps the
+# running moments of the two columns (count, means, sums of squared deviations and the co-moment), which give
+# the Pearson correlation and the least-squares line and merge like the stats of Aggregates.
+# The bootstrap is the online (Poisson) bootstrap: every row gets a Poisson(1) weight per replicate instead of
+# resampling the rows, so replicates are updated chunk by chunk and merged like the moments themselves.
+
+#moments stored per replicate, in this order
+MOMENTS = ['n', 'mean_x', 'mean_y', 'm2_x', 'm2_y', 'c_xy']
+#bootstrap weights are drawn in batches of at most this many cells (replicates x rows), 32MB of float64
+BOOTSTRAP_CELLS = 1 << 22
+
+
+def merge_moments(a, b):
+    #moments of the union of two samples, a and b are arrays with the rows of MOMENTS
+    n_a, mean_xa, mean_ya, m2_xa, m2_ya, c_a = a
+    n_b, mean_xb, mean_yb, m2_xb, m2_yb, c_b = b
+    n = n_a + n_b
+    with np.errstate(divide='ignore', invalid='ignore'):
+        share = np.where(n > 0, n_b / n, 0)
+    dx = mean_xb - mean_xa
+    dy = mean_yb - mean_ya
+    spread = n_a * share
+    return np.array([n, mean_xa + dx * share, mean_ya + dy * share, m2_xa + m2_xb + dx * dx * spread,
+                     m2_ya + m2_yb + dy * dy * spread, c_a + c_b + dx * dy * spread])
+
+
+def weighted_moments(x, y, weights):
+    #moments of x and y for every row of weights (one row per replicate)
+    n = weights.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_x = np.where(n > 0, weights @ x / n, 0)
+        mean_y = np.where(n > 0, weights @ y / n, 0)
+    dx = x - mean_x[:, None]
+    dy = y - mean_y[:, None]
+    return np.array([n, mean_x, mean_y, (weights * dx * dx).sum(axis=1), (weights * dy * dy).sum(axis=1),
+                     (weights * dx * dy).sum(axis=1)])
+
+
+class Correlation:
+    #running correlation and least-squares fit y = slope * x + intercept of two columns. Pairs with a missing
+    #value are skipped. With replicates > 0 the statistics get bootstrap confidence intervals; partitions
+    #that are merged should use different seeds.
+    def __init__(self, replicates=0, seed=None):
+        self.replicates = replicates
+        self.rng = np.random.default_rng(seed)
+        #column 0 is the sample, columns 1.. the bootstrap replicates
+        self.moments = np.zeros((len(MOMENTS), replicates + 1))
+
+    @classmethod
+    def from_columns(cls, x, y, replicates=0, seed=None):
+        return cls(replicates, seed).add(x, y)
+
+    def add(self, x, y):
+        #add a chunk of the two columns, returns self
+        x = pd.Series(x).to_numpy(dtype=np.float64, na_value=np.nan)
+        y = pd.Series(y).to_numpy(dtype=np.float64, na_value=np.nan)
+        valid = ~(np.isnan(x) | np.isnan(y))
+        x, y = x[valid], y[valid]
+        if not len(x):
+            return self
+        chunk = np.empty_like(self.moments)
+        chunk[:, :1] = weighted_moments(x, y, np.ones((1, len(x))))
+        batch = max(BOOTSTRAP_CELLS // len(x), 1)
+        for start in range(1, self.replicates + 1, batch):
+            stop = min(start + batch, self.replicates + 1)
+            weights = self.rng.poisson(1.0, size=(stop - start, len(x))).astype(np.float64)
+            chunk[:, start:stop] = weighted_moments(x, y, weights)
+        self.moments = merge_moments(self.moments, chunk)
+        return self
+
+    def merge(self, other):
+        #merge the moments of another Correlation with as many replicates, returns self
+        if other.replicates != self.replicates:
+            raise ValueError('cannot merge {} replicates into {}'.format(other.replicates, self.replicates))
+        self.moments = merge_moments(self.moments, other.moments)
+        return self
+
+    @property
+    def n(self):
+        return int(self.moments[0, 0])
+
+    def statistics(self):
+        #corr, slope and intercept of the sample (column 0) and of every replicate
+        n, mean_x, mean_y, m2_x, m2_y, c_xy = self.moments
+        with np.errstate(divide='ignore', invalid='ignore'):
+            corr = c_xy / np.sqrt(m2_x * m2_y)
+            slope = c_xy / m2_x
+        return pd.DataFrame({'corr': corr, 'slope': slope, 'intercept': mean_y - slope * mean_x})
+
+    def summary(self, confidence=0.95):
+        #estimate of corr, slope and intercept, with the percentile bootstrap interval when there are replicates
+        statistics = self.statistics()
+        summary = pd.DataFrame({'estimate': statistics.iloc[0]})
+        if self.replicates:
+            tail = (1 - confidence) / 2 * 100
+            summary['low'] = np.nanpercentile(statistics.iloc[1:], tail, axis=0)
+            summary['high'] = np.nanpercentile(statistics.iloc[1:], 100 - tail, axis=0)
+        return summary
@@ -0,0 +1,1117 @@
+# coding: utf-8
+
+# Benchmarks for the cleaning helpers against the original notebook implementations,
+# and an end-to-end suite over synthetic WeRateDogs-like data of 10k to 10M tweets.
+# Run with:  python benchmark.py [name ...] [--rows N]
+#            python benchmark.py --workers N [--rows N]
+#            python benchmark.py --startup
+#            python benchmark.py --suite [--sizes 10k 1m 10m] [--output FILE] [--compare FILE]
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+from analysis import Aggregates, Correlation
+from cleaning import (ARCHIVE_DROP_COLUMNS, SOURCE_LABELS, STAGES, TWEET_JSON_COLUMNS, SeenSet, TimeIndex,
+                      apply_corrections, archive_columns, clean_archive, clean_tweet_json, dog_stage, export_master,
+                      first_urls, merge_master, normalize_source, parse_timestamps, resolve_breed)
+from enrichment import enrich
+from gathering import fetch, predict_images, read_tweet_json
+from instrumentation import Stages
+from planning import Plan
+from pipeline import build_frames, build_master_parallel, build_master_streaming
+from storing import PREDICTION_COLUMNS, PredictionCache, read_binary, write_binary
+
+
+# ## Synthetic data
+
+ARCHIVE_COLUMNS = ['tweet_id', 'in_reply_to_status_id', 'in_reply_to_user_id', 'timestamp', 'source', 'text',
+                   'retweeted_status_id', 'retweeted_status_user_id', 'retweeted_status_timestamp', 'expanded_urls',
+                   'rating_numerator', 'rating_denominator', 'name'] + STAGES
+NAMES = np.array(['Phineas', 'Tilly', 'Archie', 'Darla', 'Franklin', 'None', 'a', 'Bella', 'Charlie', 'Cooper'],
+                 dtype=object)
+
+
+def _rng(seed, start):
+    #generators are seeded per block, the synthetic files only depend on (rows, seed, block size)
+    return np.random.default_rng([seed, start])
+
+
+def make_archive(rows, seed=0, start=0, total=None):
+    #synthetic twitter archive with the columns of twitter-archive-enhanced.csv, newest tweet first.
+    #rows start..start+rows of an archive of `total` tweets (the whole archive by default), with the quirks of
+    #the real one: html anchors in source, about 8% retweets and 1% replies, 1% bad denominators, decimal
+    #ratings stored wrong (13.5/10 captured as 5/10), dates in the text (9/11), names like 'a' and 'None',
+    #the stage columns holding the string 'None' when not set and about 1% of rows with two stages.
+    total = total or rows
+    rng = _rng(seed, start)
+    position = total - 1 - start - np.arange(rows, dtype=np.int64)
+    ids = 666020888022790149 + position * 1000
+    df = pd.DataFrame({'tweet_id': ids})
+    reply = rng.random(rows) < 0.01
+    df['in_reply_to_status_id'] = np.where(reply, ids - 7, np.nan)
+    df['in_reply_to_user_id'] = np.where(reply, 4196983835.0, np.nan)
+    first, last = pd.Timestamp('2015-11-15'), pd.Timestamp('2017-08-01 16:23:56')
+    seconds = (position / max(total - 1, 1) * (last - first).total_seconds()).astype(np.int64)
+    df['timestamp'] = (first + pd.to_timedelta(seconds, unit='s')).strftime('%Y-%m-%d %H:%M:%S +0000')
+    sources = np.array(['<a href="http://twitter.com/download/iphone" rel="nofollow">Twitter for iPhone</a>',
+                        '<a href="http://vine.co" rel="nofollow">Vine - Make a Scene</a>',
+                        '<a href="http://twitter.com" rel="nofollow">Twitter Web Client</a>',
+                        '<a href="https://about.twitter.com/products/tweetdeck" rel="nofollow">TweetDeck</a>'],
+                       dtype=object)
+    df['source'] = sources[rng.choice(len(sources), size=rows, p=[0.94, 0.04, 0.015, 0.005])]
+    numerator = rng.integers(5, 15, size=rows)
+    denominator = np.where(rng.random(rows) < 0.01, 50, 10)
+    name = NAMES[rng.integers(0, len(NAMES), size=rows)]
+    kind = rng.choice(3, size=rows, p=[0.997, 0.002, 0.001])
+    templates = np.array(['This is {}. Only ever appears in the hole of a donut. {}/{} https://t.co/MgUWQ76dJU',
+                          'This is {}. Mystical boy. {}.5/{} https://t.co/MgUWQ76dJU',
+                          'This is {}. Was a 9/11 search dog. {}/{} https://t.co/MgUWQ76dJU'], dtype=object)
+    df['text'] = [template.format(*row) for template, row in zip(templates[kind], zip(name, numerator, denominator))]
+    #the archive captured the digits after the point of decimal ratings, and the date instead of the rating
+    numerator = np.select([kind == 1, kind == 2], [5, 9], numerator)
+    denominator = np.where(kind == 2, 11, denominator)
+    retweet = rng.random(rows) < 0.08
+    df['retweeted_status_id'] = np.where(retweet, ids - 1000 * rng.integers(1, 100, size=rows), np.nan)
+    df['retweeted_status_user_id'] = np.where(retweet, 4196983835.0, np.nan)
+    df['retweeted_status_timestamp'] = np.where(retweet, df['timestamp'], None)
+    df['expanded_urls'] = ['https://twitter.com/dog_rates/status/{}/photo/1'.format(i) for i in ids]
+    df['rating_numerator'] = numerator
+    df['rating_denominator'] = denominator
+    df['name'] = name
+    picked = rng.choice(len(STAGES) + 1, size=rows, p=[0.04, 0.01, 0.1, 0.01, 0.84])
+    second = rng.random(rows) < 0.01
+    for code, s in enumerate(STAGES):
+        df[s] = np.where((picked == code) | (second & (code == 2)), s, 'None')
+    return df[ARCHIVE_COLUMNS]
+
+
+def make_corrections(df, count, seed=0):
+    #correction table for `count` random tweets of df, half deletions and half fixes
+    rng = np.random.default_rng(seed)
+    ids = rng.choice(df['tweet_id'].to_numpy(), size=count, replace=False)
+    fix = np.arange(count) % 2 == 1
+    return pd.DataFrame({'tweet_id': ids,
+                         'action': np.where(fix, 'fix', 'delete'),
+                         'rating_numerator': np.where(fix, 12, np.nan),
+                         'rating_denominator': np.where(fix, 10, np.nan)})
+
+
+def make_predictions(rows, seed=0, start=0):
+    #synthetic image predictions with the columns of image_predictions.tsv for the tweets of make_archive,
+    #oldest tweet first (rows start..start+rows). About 3% of the rows reuse the jpg_url of an earlier tweet,
+    #like retweeted photos.
+    rng = _rng(seed, start)
+    breeds = np.array(['golden_retriever', 'Labrador_retriever', 'Pembroke', 'Chihuahua', 'pug',
+                       'chow', 'Samoyed', 'toy_poodle', 'web_site', 'tennis_ball', 'seat_belt'], dtype=object)
+    position = start + np.arange(rows, dtype=np.int64)
+    photo = position.copy()
+    reused = np.flatnonzero((rng.random(rows) < 0.03) & (position > 0))
+    photo[reused] = rng.integers(0, position[reused])
+    df = pd.DataFrame({'tweet_id': 666020888022790149 + position * 1000,
+                       'jpg_url': ['https://pbs.twimg.com/media/{:015d}.jpg'.format(i) for i in photo],
+                       'img_num': rng.integers(1, 5, size=rows)})
+    conf = np.sort(rng.random((rows, 3)), axis=1)[:, ::-1]
+    for n in range(3):
+        label = rng.integers(0, len(breeds), size=rows)
+        df['p{}'.format(n + 1)] = breeds[label]
+        df['p{}_conf'.format(n + 1)] = conf[:, n]
+        df['p{}_dog'.format(n + 1)] = label < 8
+    return df
+
+
+def write_tweet_json(path, rows, seed=0, start=0, total=None, mode='w'):
+    #synthetic tweet-json.txt, one tweet per line with the nested fields of the real dump, newest tweet first
+    #(rows start..start+rows of `total`, like make_archive)
+    total = total or rows
+    rng = _rng(seed, start)
+    retweets = rng.integers(0, 80000, size=rows)
+    favorites = retweets * 3 + rng.integers(0, 10000, size=rows)
+    with open(path, mode) as file:
+        for i in range(rows):
+            tweet_id = 666020888022790149 + (total - 1 - start - i) * 1000
+            file.write(json.dumps({
+                'created_at': 'Tue Aug 01 16:23:56 +0000 2017', 'id': tweet_id, 'id_str': str(tweet_id),
+                'full_text': 'This is Phineas. He\'s a mystical boy. 13/10 https://t.co/MgUWQ76dJU',
+                'truncated': False, 'display_text_range': [0, 85],
+                'entities': {'hashtags': [], 'symbols': [], 'user_mentions': [],
+                             'urls': [], 'media': [{'id': tweet_id, 'media_url': 'http://pbs.twimg.com/media/x.jpg',
+                                                    'sizes': {'large': {'w': 540, 'h': 528, 'resize': 'fit'}}}]},
+                'extended_entities': {'media': [{'id': tweet_id, 'type': 'photo'}]},
+                'source': '<a href="http://twitter.com/download/iphone" rel="nofollow">Twitter for iPhone</a>',
+                'in_reply_to_status_id': None, 'in_reply_to_status_id_str': None, 'in_reply_to_user_id': None,
+                'in_reply_to_user_id_str': None, 'in_reply_to_screen_name': None,
+                'user': {'id': 4196983835, 'screen_name': 'dog_rates', 'followers_count': 3200889},
+                'geo': None, 'coordinates': None, 'place': None, 'contributors': None,
+                'is_quote_status': False, 'retweet_count': int(retweets[i]), 'favorite_count': int(favorites[i]),
+                'favorited': False, 'retweeted': False, 'possibly_sensitive': False,
+                'possibly_sensitive_appealable': False, 'lang': 'en'}) + '\n')
+
+
+def write_sources(directory, rows, seed=0, block=500000):
+    #write the three synthetic sources to directory, named like the real ones, `block` rows at a time so
+    #10M-row sources do not have to fit in memory. Returns their paths.
+    paths = {'archive': os.path.join(directory, 'twitter-archive-enhanced.csv'),
+             'predictions': os.path.join(directory, 'image_predictions.tsv'),
+             'tweet_json': os.path.join(directory, 'tweet-json.txt')}
+    for start in range(0, rows, block):
+        size = min(block, rows - start)
+        first = start == 0
+        make_archive(size, seed, start, rows).to_csv(paths['archive'], mode='w' if first else 'a',
+                                                     header=first, index=False)
+        make_predictions(size, seed, start).to_csv(paths['predictions'], sep='\t', mode='w' if first else 'a',
+                                                   header=first, index=False)
+        write_tweet_json(paths['tweet_json'], size, seed, start, rows, mode='w' if first else 'a')
+    return paths
+
+
+def cached_sources(directory, rows, seed=0):
+    #the synthetic sources of (rows, seed) under directory, generated on the first use
+    directory = os.path.join(directory, '{}-{}'.format(rows, seed))
+    done = os.path.join(directory, 'complete')
+    if not os.path.exists(done):
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+        write_sources(directory, rows, seed)
+        open(done, 'w').close()
+    return {'archive': os.path.join(directory, 'twitter-archive-enhanced.csv'),
+            'predictions': os.path.join(directory, 'image_predictions.tsv'),
+            'tweet_json': os.path.join(directory, 'tweet-json.txt')}
+
+
+# ## Original implementations (copied from the notebook, used as the baseline)
+
+def stage(row):
+    if row['doggo'] == 'doggo':
+        val = 'doggo'
+    elif row['floofer'] == 'floofer':
+        val = 'floofer'
+    elif row['pupper'] == 'pupper':
+        val = 'pupper'
+    elif row['puppo'] == 'puppo':
+        val = 'puppo'
+    else:
+        val = None
+    return val
+
+
+def extract_breed(row):
+    breed = ''
+    if row['p1_dog'] == True:
+        breed = row['p1']
+    elif row['p2_dog'] == True:
+        breed = row['p2']
+    elif row['p3_dog'] == True:
+        breed = row['p3']
+    else:
+        breed = None
+    return breed
+
+
+# ## Benchmarks
+
+def timed(func, *args, repeat=3):
+    #best wall time of a few runs, in seconds
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def bench_dog_stage(rows):
+    df = make_archive(rows)
+    old_time, old = timed(lambda d: d.apply(stage, axis=1), df)
+    new_time, new = timed(dog_stage, df)
+    #same values as the row-wise method (None/NaN for tweets without a stage)
+    assert (pd.Series(new, index=df.index).astype(object).where(pd.notnull(new), None)
+            .equals(old.astype(object).where(pd.notnull(old), None)))
+    return old_time, new_time
+
+
+def bench_resolve_breed(rows):
+    df = make_predictions(rows)
+    old_time, old = timed(lambda d: d.apply(lambda row: extract_breed(row), axis=1), df)
+    new_time, new = timed(resolve_breed, df)
+    assert new['breed_of_dog'].astype(object).equals(old.astype(object))
+    return old_time, new_time
+
+
+def correction_loop(df, corrections):
+    #the notebook's Issue #5 code: one query per deleted id, then one .loc per fixed value
+    for i in corrections.loc[corrections['action'] == 'delete', 'tweet_id']:
+        df = df.query('tweet_id !="{}"'.format(i))
+    df = df.copy()
+    for row in corrections[corrections['action'] == 'fix'].itertuples():
+        df.loc[df['tweet_id'] == str(row.tweet_id), 'rating_numerator'] = int(row.rating_numerator)
+        df.loc[df['tweet_id'] == str(row.tweet_id), 'rating_denominator'] = int(row.rating_denominator)
+    return df
+
+
+def bench_corrections(rows, count=200):
+    df = make_archive(rows)
+    df['tweet_id'] = df['tweet_id'].astype(str)
+    corrections = make_corrections(df.assign(tweet_id=df['tweet_id'].astype(np.int64)), count)
+    old_time, old = timed(correction_loop, df, corrections, repeat=1)
+    new_time, (new, report) = timed(apply_corrections, df, corrections)
+    assert new.equals(old) and (report['matched'] == 1).all()
+    return old_time, new_time
+
+
+def read_then_drop(path):
+    #the notebook's path: read every field, then keep three columns (Issues #11-#12)
+    tweet_json = pd.read_json(path, lines=True)
+    return clean_tweet_json(tweet_json)
+
+
+def bench_tweet_json(rows):
+    path = os.path.join(tempfile.mkdtemp(), 'tweet-json.txt')
+    write_tweet_json(path, rows)
+    try:
+        old_time, old = timed(read_then_drop, path, repeat=1)
+        new_time, new = timed(lambda p: clean_tweet_json(read_tweet_json(p)), path, repeat=1)
+        assert new[TWEET_JSON_COLUMNS].astype(str).equals(old[TWEET_JSON_COLUMNS].astype(str))
+    finally:
+        os.remove(path)
+    return old_time, new_time
+
+
+def bench_merge_master(rows):
+    archive = make_archive(rows)
+    predictions = make_predictions(rows)[['tweet_id', 'jpg_url', 'p1', 'p1_conf']].sample(frac=0.9, random_state=0)
+    tweet_json = pd.DataFrame({'tweet_id': archive['tweet_id'].to_numpy()[::-1],
+                               'favorite_count': np.arange(rows), 'retweet_count': np.arange(rows)})
+    #the notebook's path: tweet_id converted to str, then two merges
+    as_str = [df.assign(tweet_id=df['tweet_id'].astype(str)) for df in (archive, predictions, tweet_json)]
+    old_time, old = timed(lambda a, p, t: pd.merge(pd.merge(a, p, how='left', on=['tweet_id']), t,
+                                                   how='left', on=['tweet_id']), *as_str)
+    new_time, new = timed(merge_master, archive, predictions, tweet_json)
+    assert new.assign(tweet_id=new['tweet_id'].astype(str)).astype(object).equals(old.astype(object))
+    return old_time, new_time
+
+
+def source_contains(source):
+    #the notebook's Issue #4 code: one str.contains scan and .loc write per client
+    source = source.copy()
+    for pattern, label in SOURCE_LABELS:
+        source.loc[source.str.contains(pattern)] = label
+    return source
+
+
+#clients whose source contains two of the SOURCE_LABELS patterns, the first one gives the name
+TWO_PATTERN_SOURCES = ['<a href="http://twitter.com/download/iphone" rel="nofollow">Twitter Web App for iPhone</a>',
+                       '<a href="https://vine.co" rel="nofollow">Vine - Make a Scene on the Web</a>',
+                       '<a href="https://about.twitter.com/products/tweetdeck" rel="nofollow">TweetDeck Web</a>']
+
+
+def bench_source(rows):
+    df = make_archive(rows)
+    #the two pattern clients replace a few rows
+    source = df['source'].astype(object)
+    source.iloc[:len(TWO_PATTERN_SOURCES)] = TWO_PATTERN_SOURCES
+    old_time, old = timed(source_contains, source)
+    new_time, new = timed(normalize_source, source)
+    assert new.astype(object).equals(old.astype(object))
+    assert list(new.iloc[:3]) == ['Twitter for iPhone', 'Vine', 'Twitter for Web']
+    return old_time, new_time
+
+
+def dedup_strings(chunks):
+    #the streaming build before hashing: drop_duplicates per chunk and a set of every jpg_url string kept so far
+    seen, kept = set(), []
+    for chunk in chunks:
+        chunk = chunk.drop_duplicates(subset='jpg_url', keep='first')
+        chunk = chunk[~chunk['jpg_url'].isin(seen)]
+        seen.update(chunk['jpg_url'])
+        kept.append(chunk['tweet_id'])
+    return pd.concat(kept, ignore_index=True)
+
+
+def dedup_digests(chunks):
+    seen, kept = SeenSet(), []
+    for chunk in chunks:
+        kept.append(chunk['tweet_id'][first_urls(chunk['jpg_url'], seen)])
+    return pd.concat(kept, ignore_index=True)
+
+
+def bench_jpg_dedup(rows, chunksize=100000):
+    df = make_predictions(rows)
+    chunks = [df.iloc[i:i + chunksize] for i in range(0, rows, chunksize)]
+    old_time, old = timed(dedup_strings, chunks)
+    new_time, new = timed(dedup_digests, chunks)
+    assert new.equals(old)
+    return old_time, new_time
+
+
+def breed_insights(master):
+    #the notebook's insights 1, 2 and the filtered visualization: a groupby per question and a python
+    #lambda per breed in filter()
+    retweets = master.groupby('breed_of_dog', observed=True)['retweet_count'].mean()
+    favorites = master.groupby('breed_of_dog', observed=True)['favorite_count'].mean()
+    filtered = master.groupby('breed_of_dog', observed=True).filter(lambda x: len(x) > 15)
+    ratings = filtered.groupby('breed_of_dog', observed=True)['rating_numerator'].mean()
+    return retweets, favorites, ratings
+
+
+def breed_insights_aggregates(master):
+    breeds = Aggregates.from_frame(master).table('breed_of_dog')
+    ratings = breeds[(breeds['rows']['count'] > 15).to_numpy()]['rating_numerator']['mean']
+    return breeds['retweet_count']['mean'], breeds['favorite_count']['mean'], ratings
+
+
+def bench_aggregates(rows):
+    archive = make_archive(rows)
+    rng = _rng(0, 0)
+    #breed names of make_predictions, with a long tail of rare breeds so filter() has many groups
+    breeds = resolve_breed(make_predictions(rows))['breed_of_dog'].to_numpy(dtype=object)
+    rare = rng.random(rows) < 0.2
+    breeds[rare] = ['breed_{}'.format(i) for i in rng.integers(0, max(rows // 50, 1), size=rare.sum())]
+    master = pd.DataFrame({'breed_of_dog': pd.Categorical(breeds), 'dog_stage': dog_stage(archive),
+                           'source': normalize_source(archive['source']),
+                           'rating_numerator': archive['rating_numerator'].to_numpy(),
+                           'retweet_count': rng.integers(0, 80000, size=rows),
+                           'favorite_count': rng.integers(0, 160000, size=rows)})
+    old_time, old = timed(breed_insights, master)
+    new_time, new = timed(breed_insights_aggregates, master)
+    for expected, got in zip(old, new):
+        assert np.allclose(got.reindex(expected.index.astype(str)).to_numpy(), expected.to_numpy())
+    return old_time, new_time
+
+
+def bootstrap_resample(x, y, replicates, seed=0):
+    #np.corrcoef and np.polyfit on the complete pairs, then once per resample of the rows
+    valid = ~(np.isnan(x) | np.isnan(y))
+    x, y = x[valid], y[valid]
+    rng = np.random.default_rng(seed)
+    statistics = []
+    for sample in [np.arange(len(x))] + [rng.integers(0, len(x), size=len(x)) for _ in range(replicates)]:
+        slope, intercept = np.polyfit(x[sample], y[sample], 1)
+        statistics.append((np.corrcoef(x[sample], y[sample])[0, 1], slope, intercept))
+    return pd.DataFrame(statistics, columns=['corr', 'slope', 'intercept'])
+
+
+def bench_correlation(rows, replicates=200, chunksize=100000):
+    rng = _rng(0, 0)
+    x = rng.gamma(2.0, 2000.0, size=rows)
+    y = 3 * x + rng.normal(0, 3000, size=rows)
+    x[rng.random(rows) < 0.01] = np.nan
+    old_time, old = timed(bootstrap_resample, x, y, replicates)
+
+    def online(x, y):
+        correlation = Correlation(replicates, seed=0)
+        for start in range(0, rows, chunksize):
+            correlation.add(x[start:start + chunksize], y[start:start + chunksize])
+        return correlation.statistics()
+    new_time, new = timed(online, x, y)
+    assert np.allclose(new.iloc[0], old.iloc[0])
+    return old_time, new_time
+
+
+def scatter_plot(x, y, path):
+    #the notebook's regplot without its bootstrap band: every point drawn, then the fitted line
+    from plotting import new_figure
+    figure = new_figure((8, 6))
+    ax = figure.add_subplot()
+    valid = ~(np.isnan(x) | np.isnan(y))
+    ax.scatter(x[valid], y[valid], s=2)
+    slope, intercept = np.polyfit(x[valid], y[valid], 1)
+    ax.plot(x[valid], slope * x[valid] + intercept, color='red')
+    figure.savefig(path, dpi=100)
+
+
+def binned_plot(x, y, path, chunksize=100000):
+    from plotting import Engagement, plot_engagement
+    engagement = Engagement(seed=0)
+    for start in range(0, len(x), chunksize):
+        engagement.add(x[start:start + chunksize], y[start:start + chunksize])
+    plot_engagement(path, engagement)
+
+
+def bench_engagement_plot(rows):
+    #render time of the engagement plot, matplotlib is needed for this one
+    rng = _rng(0, 0)
+    x = rng.gamma(1.0, 3000.0, size=rows)
+    y = 3 * x + rng.gamma(1.0, 3000.0, size=rows)
+    directory = tempfile.mkdtemp()
+    try:
+        old_time, _ = timed(scatter_plot, x, y, os.path.join(directory, 'scatter.png'))
+        new_time, _ = timed(binned_plot, x, y, os.path.join(directory, 'binned.png'))
+    finally:
+        shutil.rmtree(directory)
+    return old_time, new_time
+
+
+def infer_timestamps(archive, created_at):
+    #the notebook's pd.to_datetime with an inferred format, and created_at with its explicit %a %b ... %z format
+    return (pd.to_datetime(archive, utc=True),
+            pd.to_datetime(created_at, format='%a %b %d %H:%M:%S %z %Y', utc=True))
+
+
+def bench_timestamps(rows):
+    archive = make_archive(rows)['timestamp']
+    created_at = pd.Series(pd.to_datetime(archive, utc=True).dt.strftime('%a %b %d %H:%M:%S +0000 %Y'))
+    old_time, old = timed(infer_timestamps, archive, created_at)
+    new_time, new = timed(lambda a, c: (parse_timestamps(a), parse_timestamps(c)), archive, created_at)
+    for expected, got in zip(old, new):
+        assert (got == expected).all()
+    return old_time, new_time
+
+
+def bench_time_slices(rows, queries=1000):
+    times = parse_timestamps(make_archive(rows)['timestamp'])
+    rng = _rng(0, 0)
+    starts = times.min() + (times.max() - times.min()) * rng.random(queries)
+    ranges = [(start, start + pd.Timedelta(days=30)) for start in starts]
+
+    def masks(times):
+        return [np.flatnonzero(((times >= start) & (times < end)).to_numpy()) for start, end in ranges]
+
+    def binary_searches(times):
+        index = TimeIndex(times)
+        return [index.positions(start, end) for start, end in ranges]
+    old_time, old = timed(masks, times)
+    new_time, new = timed(binary_searches, times)
+    assert all(np.array_equal(np.sort(a), np.sort(b)) for a, b in zip(old, new))
+    return old_time, new_time
+
+
+class MockClassifier:
+    #stands for the image classifier: answers the predictions of make_predictions for a list of urls, at a
+    #cost of `seconds` per image (far below a real network, so the baseline is flattered)
+    def __init__(self, predictions, seconds=2e-5):
+        self.predictions = predictions.drop_duplicates('jpg_url').set_index('jpg_url')[PREDICTION_COLUMNS]
+        self.seconds = seconds
+        self.images = 0
+
+    def __call__(self, urls):
+        self.images += len(urls)
+        time.sleep(self.seconds * len(urls))
+        return self.predictions.loc[urls].reset_index(drop=True)
+
+
+def classify_every_row(images, classify):
+    #every row classified on every run, duplicate images included
+    predictions = images[['tweet_id', 'jpg_url', 'img_num']].reset_index(drop=True)
+    return pd.concat([predictions, classify(list(images['jpg_url']))], axis=1)
+
+
+def bench_prediction_cache(rows):
+    #a rebuild after 2% new tweets, the cache holding the predictions of the earlier run
+    new_rows = max(rows // 50, 1)
+    predictions = pd.concat([make_predictions(rows), make_predictions(new_rows, start=rows)], ignore_index=True)
+    images = predictions[['tweet_id', 'jpg_url', 'img_num']]
+    classify = MockClassifier(predictions)
+    directory = tempfile.mkdtemp()
+    try:
+        cache = PredictionCache(os.path.join(directory, 'predictions.sqlite'))
+        predict_images(images.iloc[:rows], classify, cache)
+        old_time, old = timed(classify_every_row, images, classify, repeat=1)
+        classify.images = 0
+        start = time.perf_counter()
+        new = predict_images(images, classify, cache)
+        new_time = time.perf_counter() - start
+        #only the new images of the new tweets were classified
+        assert classify.images == predictions['jpg_url'].iloc[rows:].drop_duplicates().isin(
+            predictions['jpg_url'].iloc[:rows]).eq(False).sum()
+        pd.testing.assert_frame_equal(new, old)
+        cache.close()
+    finally:
+        shutil.rmtree(directory)
+    return old_time, new_time
+
+
+MASTER_QUERY_COLUMNS = ['tweet_id', 'breed_of_dog', 'retweet_count']
+
+
+def csv_round_trip(master, path, since):
+    #write the master as csv, read it back and query the puppers since `since`, parsing the timestamps again
+    master.to_csv(path, index=True)
+    df = pd.read_csv(path, usecols=MASTER_QUERY_COLUMNS + ['timestamp', 'dog_stage'])
+    df['timestamp'] = parse_timestamps(df['timestamp'])
+    return df[(df['timestamp'] >= since) & (df['dog_stage'] == 'pupper')][MASTER_QUERY_COLUMNS]
+
+
+def query_puppers(master, since):
+    mask = (master['timestamp'] >= since) & (master['dog_stage'] == 'pupper')
+    return master[mask.fillna(False).astype(bool)][MASTER_QUERY_COLUMNS].reset_index(drop=True)
+
+
+def binary_round_trip(master, path, since):
+    write_binary(master, path)
+    return read_binary(path, MASTER_QUERY_COLUMNS, [('timestamp', '>=', since), ('dog_stage', '==', 'pupper')])
+
+
+def bench_binary_export(rows):
+    directory = tempfile.mkdtemp()
+    try:
+        paths = write_sources(directory, rows)
+        master = export_master(build_frames(paths['archive'], paths['predictions'], paths['tweet_json'],
+                                            'rating_corrections.csv')['twitter_archive_master'])
+        #the newest tenth of the tweets
+        since = master['timestamp'].quantile(0.9)
+        path = os.path.join(directory, 'twitter_archive_master.csv')
+        old_time, old = timed(csv_round_trip, master, path, since)
+        new_time, new = timed(binary_round_trip, master, path, since)
+        assert new.astype(str).equals(old.reset_index(drop=True).astype(str))
+        #filters written as in the README: a date string for a UTC timestamp column, read from parquet and from
+        #the memory-mapped feather file
+        day = since.strftime('%Y-%m-%d')
+        expected = query_puppers(master, pd.Timestamp(day, tz='UTC')).astype(str)
+        for memory_map in (False, True):
+            found = read_binary(path, MASTER_QUERY_COLUMNS, [('timestamp', '>=', day), ('dog_stage', '==', 'pupper')],
+                                memory_map=memory_map)
+            assert found.astype(str).equals(expected), memory_map
+    finally:
+        shutil.rmtree(directory)
+    return old_time, new_time
+
+
+def clean_archive_cells(path, corrections):
+    #the archive cleaning cells of the notebook: the whole csv is read and every issue reassigns the frame
+    df = pd.read_csv(path)
+    df = df[pd.isnull(df['retweeted_status_user_id'])].copy()
+    df['timestamp'] = parse_timestamps(df['timestamp'])
+    df['tweet_id'] = df['tweet_id'].astype(np.int64)
+    df['source'] = normalize_source(df['source'])
+    df, report = apply_corrections(df, corrections)
+    df['dog_stage'] = dog_stage(df)
+    df = df.drop(STAGES, axis=1)
+    df = df.drop(ARCHIVE_DROP_COLUMNS, axis=1)
+    return df, report
+
+
+def clean_archive_planned(path, corrections):
+    #only the columns the optimized plan reads are parsed
+    return clean_archive(pd.read_csv(path, usecols=archive_columns(path)), corrections)
+
+
+def notebook_order_plan():
+    #the archive steps in the order a notebook tends to write them, derives first and the filter last, with a
+    #column nothing uses (source_label) and a select that leaves out text
+    return (Plan('notebook_order')
+            .cast('timestamp', parse_timestamps)
+            .cast('source', normalize_source)
+            .derive('dog_stage', dog_stage, STAGES)
+            .derive('source_label', lambda df: df['source'].astype(str), ['source'])
+            .drop(STAGES)
+            .filter('drop_retweets', lambda df: df['retweeted_status_user_id'].isnull(), ['retweeted_status_user_id'])
+            .drop(ARCHIVE_DROP_COLUMNS)
+            .select(['tweet_id', 'timestamp', 'source', 'dog_stage', 'rating_numerator']))
+
+
+def check_plan_optimizer(archive):
+    #the optimized notebook_order_plan runs the filter first and reads fewer columns, with the same result
+    plan = notebook_order_plan()
+    optimized = plan.optimize(archive.columns)
+    assert optimized.steps[0].kind == 'filter'
+    assert any(note.startswith('filter drop_retweets moved before timestamp, source, dog_stage')
+               for note in optimized.notes)
+    assert 'source_label' not in [step.name for step in optimized.steps]
+    assert not {'text', 'expanded_urls', 'name'} & set(optimized.read_columns)
+    expected, _ = plan.execute(archive)
+    got, _ = optimized.execute(archive[optimized.read_columns])
+    pd.testing.assert_frame_equal(got, expected)
+
+
+def bench_cleaning_plan(rows):
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'twitter-archive-enhanced.csv')
+        archive = make_archive(rows)
+        archive.to_csv(path, index=False)
+        corrections = make_corrections(archive.assign(tweet_id=archive['tweet_id'].astype(np.int64)), 200)
+        check_plan_optimizer(pd.read_csv(path))
+        old_time, (old, old_report) = timed(clean_archive_cells, path, corrections)
+        new_time, (new, new_report) = timed(clean_archive_planned, path, corrections)
+        pd.testing.assert_frame_equal(new, old)
+        pd.testing.assert_frame_equal(new_report, old_report)
+    finally:
+        shutil.rmtree(directory)
+    return old_time, new_time
+
+
+# ## Mock lookup API
+#
+# A local server with the statuses/show (one id) and statuses/lookup (ids separated by commas) endpoints of
+# the Twitter API, for the enrichment benchmark. It answers after `latency` seconds, allows `limit` requests
+# per `window` seconds with the x-rate-limit-* headers (429 once they are used up), and answers 500 to every
+# request after the first `fail_after` ones, like a crash of the connection.
+
+class MockLookupServer:
+    def __init__(self, tweets, latency=0.01, limit=None, window=1.0, fail_after=None):
+        self.tweets = tweets
+        self.latency = latency
+        self.limit = limit
+        self.window = window
+        self.fail_after = fail_after
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.window_start = time.time()
+        self.window_used = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                status, headers, body = server.answer(urlparse(self.path))
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:{}'.format(self.httpd.server_address[1])
+
+    def answer(self, url):
+        with self.lock:
+            self.requests += 1
+            failed = self.fail_after is not None and self.requests > self.fail_after
+            headers = {'Content-Type': 'application/json'}
+            if self.limit is not None:
+                now = time.time()
+                if now >= self.window_start + self.window:
+                    self.window_start, self.window_used = now, 0
+                self.window_used += 1
+                headers['x-rate-limit-limit'] = str(self.limit)
+                headers['x-rate-limit-remaining'] = str(max(self.limit - self.window_used, 0))
+                headers['x-rate-limit-reset'] = str(self.window_start + self.window)
+                if self.window_used > self.limit:
+                    return 429, headers, b'[]'
+        time.sleep(self.latency)
+        if failed:
+            return 500, headers, b'{}'
+        ids = [int(tweet_id) for tweet_id in parse_qs(url.query)['id'][0].split(',')]
+        found = [self.tweets[tweet_id] for tweet_id in ids if tweet_id in self.tweets]
+        if url.path.endswith('/show.json'):
+            return (200, headers, json.dumps(found[0]).encode()) if found else (404, headers, b'{}')
+        return 200, headers, json.dumps(found).encode()
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def lookup_one_by_one(ids, url, path):
+    #one blocking statuses/show request per tweet_id
+    import requests
+    with requests.Session() as session, open(path, 'w') as file:
+        for tweet_id in ids:
+            response = session.get(url + '/show.json', params={'id': tweet_id})
+            if response.status_code == 200:
+                file.write(response.text + '\n')
+
+
+def bench_enrichment(rows, latency=0.005):
+    #at most 1000 ids, the one by one baseline costs `latency` per id
+    rows = min(rows, 1000)
+    ids = (666020888022790149 + np.arange(rows, dtype=np.int64) * 1000).tolist()
+    #about 2% of the tweets were deleted and are not returned
+    tweets = {tweet_id: {'id': tweet_id, 'retweet_count': n, 'favorite_count': 3 * n}
+              for n, tweet_id in enumerate(ids) if n % 50 != 7}
+    directory = tempfile.mkdtemp()
+    try:
+        with MockLookupServer(tweets, latency) as server:
+            old_path = os.path.join(directory, 'one-by-one.txt')
+            old_time, _ = timed(lookup_one_by_one, ids, server.url, old_path, repeat=1)
+            new_path = os.path.join(directory, 'batched.txt')
+            start = time.perf_counter()
+            enrich(ids, server.url + '/lookup.json', new_path, rate=1000)
+            new_time = time.perf_counter() - start
+        old, new = read_tweet_json(old_path), read_tweet_json(new_path)
+        assert old.sort_values('id').reset_index(drop=True).equals(new.sort_values('id').reset_index(drop=True))
+
+        #a run that fails half way resumes where it stopped, under a rate limit of 3 requests per 0.2s
+        resumed = os.path.join(directory, 'resumed.txt')
+        with MockLookupServer(tweets, latency, limit=3, window=0.2, fail_after=4) as server:
+            try:
+                enrich(ids, server.url + '/lookup.json', resumed, rate=1000, retries=1)
+                raise AssertionError('the failing server did not stop the run')
+            except IOError:
+                pass
+        with MockLookupServer(tweets, latency, limit=3, window=0.2) as server:
+            enrich(ids, server.url + '/lookup.json', resumed, rate=1000)
+        resumed = read_tweet_json(resumed)
+        assert resumed['id'].is_unique and set(resumed['id']) == set(tweets)
+    finally:
+        shutil.rmtree(directory)
+    return old_time, new_time
+
+
+# ## Mock file server
+#
+# A local server of one file, like the CloudFront URL of image-predictions.tsv: it sends an ETag (unless
+# etag=False) and a Last-Modified date, answers 304 to If-None-Match / If-Modified-Since, 206 to a Range
+# request whose If-Range still matches, 200 with the whole file when it does not, and 416 to a range past the
+# end. With `cut` set, the next answer stops after that many bytes of the body, like a dropped connection.
+
+class MockFileServer:
+    def __init__(self, body, etag=True):
+        self.etag = etag
+        self.version = 0
+        self.change(body)
+        self.cut = None
+        #status, Range and If-Range of every request
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                #taken before answering, the thread of the previous request may still be running
+                cut, server.cut = server.cut, None
+                status, headers, body = server.answer(self.headers)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if cut is not None:
+                    body = body[:cut]
+                    self.close_connection = True
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:{}/image-predictions.tsv'.format(self.httpd.server_address[1])
+
+    def change(self, body):
+        self.body = body
+        self.version += 1
+        self.last_modified = formatdate(1500000000 + 3600 * self.version, usegmt=True)
+
+    def validators(self):
+        validators = {'Last-Modified': self.last_modified}
+        if self.etag:
+            validators['ETag'] = '"v{}"'.format(self.version)
+        return validators
+
+    def answer(self, request):
+        headers = self.validators()
+        status, body = 200, self.body
+        if request.get('Range'):
+            if request.get('If-Range') in (None, headers.get('ETag'), self.last_modified):
+                start = int(request['Range'][len('bytes='):-1])
+                if start >= len(self.body):
+                    status, body = 416, b''
+                    headers['Content-Range'] = 'bytes */{}'.format(len(self.body))
+                else:
+                    status, body = 206, self.body[start:]
+                    headers['Content-Range'] = 'bytes {}-{}/{}'.format(start, len(self.body) - 1, len(self.body))
+        elif request.get('If-None-Match') is not None:
+            if request['If-None-Match'] == headers.get('ETag'):
+                status, body = 304, b''
+        elif request.get('If-Modified-Since') == self.last_modified:
+            status, body = 304, b''
+        self.requests.append((status, request.get('Range'), request.get('If-Range')))
+        return status, headers, body
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def interrupted_fetch(server, path, session, body):
+    #serve body and drop the connection half way through it, leaving <path>.part
+    import requests
+    server.change(body)
+    server.cut = len(body) // 2
+    try:
+        fetch(server.url, path, session, chunk_size=1024)
+        raise AssertionError('the dropped connection did not stop the download')
+    except requests.RequestException:
+        pass
+    assert 0 < os.path.getsize(path + '.part') < len(body)
+
+
+def read_bytes(path):
+    with open(path, 'rb') as file:
+        return file.read()
+
+
+def check_fetch(directory, body):
+    import requests
+    path = os.path.join(directory, 'fetched.tsv')
+    versions = [body + str(n).encode() * 100 for n in range(4)]
+    with MockFileServer(versions[0]) as server, requests.Session() as session:
+        assert fetch(server.url, path, session) and read_bytes(path) == versions[0]
+        assert server.requests[-1][0] == 200
+        #unchanged: If-None-Match with the ETag
+        assert not fetch(server.url, path, session) and server.requests[-1][0] == 304
+        #interrupted, then resumed from the end of the part
+        interrupted_fetch(server, path, session, versions[1])
+        assert fetch(server.url, path, session, chunk_size=1024) and read_bytes(path) == versions[1]
+        assert server.requests[-1][0] == 206 and server.requests[-1][2] == server.validators()['ETag']
+        #interrupted, and the file changed before the resume: the ETag no longer matches and it starts over
+        interrupted_fetch(server, path, session, versions[2])
+        server.change(versions[3])
+        assert fetch(server.url, path, session) and read_bytes(path) == versions[3]
+        status, sent_range, _ = server.requests[-1]
+        assert status == 200 and sent_range is not None
+        #a part longer than the file and no complete file: 416, the part is removed and the file downloaded again
+        os.remove(path)
+        with open(path + '.part', 'wb') as file:
+            file.write(versions[3] + b'tail')
+        with open(path + '.meta') as file:
+            meta = json.load(file)
+        with open(path + '.meta', 'w') as file:
+            json.dump(dict(meta, part_etag=meta['etag']), file)
+        assert fetch(server.url, path, session) and read_bytes(path) == versions[3]
+        assert [request[0] for request in server.requests[-2:]] == [416, 200]
+    os.remove(path)
+    #without an ETag, the Last-Modified date is the validator
+    with MockFileServer(versions[0], etag=False) as server, requests.Session() as session:
+        assert fetch(server.url, path, session)
+        assert not fetch(server.url, path, session) and server.requests[-1][0] == 304
+        interrupted_fetch(server, path, session, versions[1])
+        assert fetch(server.url, path, session, chunk_size=1024) and read_bytes(path) == versions[1]
+        assert server.requests[-1][0] == 206 and server.requests[-1][2] == server.last_modified
+
+
+def download_every_time(url, path, session):
+    with open(path, 'wb') as file:
+        file.write(session.get(url).content)
+
+
+def bench_fetch(rows):
+    #downloading image-predictions.tsv again on every run against a conditional request answered 304
+    import requests
+    body = make_predictions(rows).to_csv(sep='\t', index=False).encode()
+    directory = tempfile.mkdtemp()
+    try:
+        with MockFileServer(body) as server, requests.Session() as session:
+            path = os.path.join(directory, 'image_predictions.tsv')
+            old_time, _ = timed(download_every_time, server.url, path, session)
+            new_time, _ = timed(fetch, server.url, path, session)
+        check_fetch(directory, body)
+    finally:
+        shutil.rmtree(directory)
+    return old_time, new_time
+
+
+BENCHMARKS = {
+    'dog_stage': bench_dog_stage,
+    'resolve_breed': bench_resolve_breed,
+    'corrections': bench_corrections,
+    'tweet_json': bench_tweet_json,
+    'merge_master': bench_merge_master,
+    'source': bench_source,
+    'jpg_dedup': bench_jpg_dedup,
+    'aggregates': bench_aggregates,
+    'correlation': bench_correlation,
+    'engagement_plot': bench_engagement_plot,
+    'timestamps': bench_timestamps,
+    'time_slices': bench_time_slices,
+    'enrichment': bench_enrichment,
+    'prediction_cache': bench_prediction_cache,
+    'binary_export': bench_binary_export,
+    'cleaning_plan': bench_cleaning_plan,
+    'fetch': bench_fetch,
+}
+
+
+def scaling_parallel(rows, max_workers):
+    #wall time of build_master_parallel with 1 to max_workers worker processes
+    directory = tempfile.mkdtemp()
+    try:
+        paths = write_sources(directory, rows)
+        for workers in range(1, max_workers + 1):
+            start = time.perf_counter()
+            build_master_parallel(paths['archive'], paths['predictions'], paths['tweet_json'],
+                                  'rating_corrections.csv', workers=workers)
+            yield workers, time.perf_counter() - start
+    finally:
+        shutil.rmtree(directory)
+
+
+# ## Startup
+#
+# Cold-start import time of the modules behind every subcommand of wrangle.py, measured with
+# python -X importtime in a fresh interpreter. The data steps must not load the plotting or HTTP libraries.
+#   python benchmark.py --startup
+
+#module imported by each subcommand, and the packages it may load at startup
+STARTUP_MODULES = {
+    'wrangle': [],
+    'gathering': ['pandas', 'numpy', 'orjson'],
+    'enrichment': ['pandas', 'numpy', 'orjson'],
+    'pipeline': ['pandas', 'numpy', 'orjson'],
+    'analysis': ['pandas', 'numpy'],
+    'plotting': ['pandas', 'numpy'],
+}
+#pyarrow is not listed, pandas tries to import it on its own
+HEAVY_IMPORTS = ['matplotlib', 'seaborn', 'requests', 'pandas', 'numpy']
+
+
+def import_times(module, repeat=3):
+    #cumulative import time in seconds of every module loaded by `import module` in a fresh interpreter
+    #(the fastest of a few runs), from the -X importtime lines "import time: self | cumulative | name"
+    best = {}
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+                                capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        for line in result.stderr.splitlines():
+            fields = line[len('import time:'):].split('|')
+            if line.startswith('import time:') and len(fields) == 3 and fields[1].strip().isdigit():
+                name = fields[2].strip()
+                seconds = int(fields[1]) / 1e6
+                best[name] = min(best.get(name, seconds), seconds)
+    return best
+
+
+def startup_report(modules=STARTUP_MODULES):
+    #(module, import seconds, heavy packages loaded, heavy packages loaded but not allowed) per module
+    report = []
+    for module, allowed in modules.items():
+        times = import_times(module)
+        loaded = sorted({name.split('.')[0] for name in times} & set(HEAVY_IMPORTS))
+        report.append((module, times.get(module), loaded, [name for name in loaded if name not in allowed]))
+    return report
+
+
+# ## Suite
+#
+# The suite builds the master from synthetic sources of each size (generated once under --data-dir) in the
+# in-memory and streaming modes, and keeps the fastest of --repeat runs with the time of every stage.
+# The results are written as JSON with the commit and versions they were measured with, so two runs
+# can be compared with --compare.
+#   python benchmark.py --suite --sizes 10k 1m --output bench.json
+#   python benchmark.py --suite --sizes 10k 1m --compare bench.json
+
+SIZES = {'10k': 10000, '100k': 100000, '1m': 1000000, '10m': 10000000}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_mode(mode, paths, output_path, stages):
+    if mode == 'memory':
+        master = build_frames(paths['archive'], paths['predictions'], paths['tweet_json'],
+                              'rating_corrections.csv', stages=stages)['twitter_archive_master']
+        with stages.stage('write_master', len(master)):
+            export_master(master).to_csv(output_path, index=True)
+    else:
+        build_master_streaming(paths['archive'], paths['predictions'], paths['tweet_json'],
+                               'rating_corrections.csv', output_path, stages=stages)
+
+
+def run_suite(sizes, data_dir, repeat=3, seed=0, modes=('memory', 'streaming')):
+    results = {'commit': git_commit(), 'python': platform.python_version(), 'pandas': pd.__version__,
+               'numpy': np.__version__, 'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+               'seed': seed, 'runs': []}
+    for size in sizes:
+        rows = SIZES.get(size) or int(size)
+        paths = cached_sources(data_dir, rows, seed)
+        output_path = os.path.join(data_dir, 'twitter_archive_master.csv')
+        for mode in modes:
+            best = None
+            for _ in range(repeat):
+                stages = Stages()
+                start = time.perf_counter()
+                run_mode(mode, paths, output_path, stages)
+                total = time.perf_counter() - start
+                if best is None or total < best['total_wall_s']:
+                    best = {'rows': rows, 'mode': mode, 'total_wall_s': total, 'stages': stages.report()['stages']}
+            results['runs'].append(best)
+            print('{:<10} rows={:<10} total={:>9.4f}s'.format(mode, rows, best['total_wall_s']))
+    return results
+
+
+def compare_suites(old, new):
+    #(rows, mode, stage, old seconds, new seconds) for every stage measured in both results
+    def times(results):
+        measured = {}
+        for run in results['runs']:
+            measured[(run['rows'], run['mode'], 'total')] = run['total_wall_s']
+            for stage in run['stages']:
+                measured[(run['rows'], run['mode'], stage['stage'])] = stage['wall_s']
+        return measured
+    old_times, new_times = times(old), times(new)
+    return [key + (old_times[key], new_times[key]) for key in new_times if key in old_times]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='benchmark the cleaning helpers')
+    parser.add_argument('names', nargs='*', help='benchmarks to run (default: all)')
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--workers', type=int, help='time the parallel build with 1 to WORKERS processes instead')
+    parser.add_argument('--suite', action='store_true', help='run the end-to-end suite instead')
+    parser.add_argument('--sizes', nargs='+', default=['10k'], help='suite sizes: 10k, 100k, 1m, 10m or a number')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'wrangle-benchmark'))
+    parser.add_argument('--output', help='write the suite results to this JSON file')
+    parser.add_argument('--compare', help='compare the suite results with this earlier JSON file')
+    parser.add_argument('--startup', action='store_true',
+                        help='measure the import time of the wrangle.py subcommands, fails on unexpected imports')
+    args = parser.parse_args(argv)
+    if args.startup:
+        failed = False
+        for module, seconds, loaded, unexpected in startup_report():
+            print('{:<20} import={:>8.4f}s loads: {}{}'.format(
+                module, seconds, ', '.join(loaded) or '-',
+                '  UNEXPECTED: ' + ', '.join(unexpected) if unexpected else ''))
+            failed = failed or bool(unexpected)
+        if failed:
+            raise SystemExit(1)
+        return
+    if args.suite:
+        results = run_suite(args.sizes, args.data_dir, args.repeat, args.seed)
+        if args.output:
+            with open(args.output, 'w') as file:
+                json.dump(results, file, indent=2)
+        if args.compare:
+            with open(args.compare) as file:
+                old = json.load(file)
+            print('compared with commit {}'.format(old.get('commit')))
+            for rows, mode, stage, old_time, new_time in compare_suites(old, results):
+                print('{:<10} rows={:<10} {:<28} old={:>9.4f}s new={:>9.4f}s ratio={:>6.2f}'.format(
+                    mode, rows, stage, old_time, new_time, new_time / old_time if old_time else float('nan')))
+        return
+    if args.workers:
+        base = None
+        for workers, seconds in scaling_parallel(args.rows, args.workers):
+            base = base or seconds
+            print('{:<20} rows={:<10} workers={:<3} time={:>9.4f}s speedup={:>8.1f}x'.format(
+                'parallel', args.rows, workers, seconds, base / seconds))
+        return
+    for name in args.names or BENCHMARKS:
+        old_time, new_time = BENCHMARKS[name](args.rows)
+        print('{:<20} rows={:<10} old={:>9.4f}s new={:>9.4f}s speedup={:>8.1f}x'.format(
+            name, args.rows, old_time, new_time, old_time / new_time))
+
+
+if __name__ == '__main__':
+    main()
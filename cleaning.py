@@ -0,0 +1,584 @@
+# coding: utf-8
+
+# Column-wise cleaning helpers used by wrangle_act.py.
+# Every function here works on whole columns at once (no row-wise apply), so the
+# cleaning steps keep the same cost per row whether the archive has 2k or 10M tweets.
+
+import functools
+import html
+import re
+
+import numpy as np
+import pandas as pd
+
+from planning import Plan
+
+
+# ## Issues #3 and #8: retweets and duplicate jpg_url
+
+class SeenSet:
+    #set of 64-bit integers (tweet_ids or url digests) kept as sorted numpy blocks: 8 bytes per value
+    #instead of a python object per value. New values go to a new block, blocks are merged once there
+    #are more than max_blocks of them, so a lookup is a few binary searches.
+    def __init__(self, dtype=np.uint64, max_blocks=8):
+        self.dtype = dtype
+        self.max_blocks = max_blocks
+        self.blocks = []
+
+    def __len__(self):
+        return sum(len(block) for block in self.blocks)
+
+    def contains(self, values):
+        #boolean mask of the values already in the set
+        values = np.asarray(values, dtype=self.dtype)
+        found = np.zeros(len(values), dtype=bool)
+        for block in self.blocks:
+            pos = np.minimum(np.searchsorted(block, values), len(block) - 1)
+            found |= block[pos] == values
+        return found
+
+    def add(self, values):
+        values = np.unique(np.asarray(values, dtype=self.dtype))
+        if len(values):
+            self.blocks.append(values)
+        if len(self.blocks) > self.max_blocks:
+            self.blocks = [np.unique(np.concatenate(self.blocks))]
+
+
+def url_digests(urls):
+    #fixed-width 64-bit digest of every url (collisions are negligible below billions of urls)
+    return pd.util.hash_array(np.asarray(urls, dtype=object))
+
+
+def first_urls(urls, seen=None):
+    #mask of the rows to keep: the first occurrence of every url in the order of the rows, also dropping
+    #the urls already in `seen` (a SeenSet of digests from earlier chunks), which is updated with the kept ones
+    digests = url_digests(urls)
+    keep = ~pd.Index(digests).duplicated(keep='first')
+    if seen is not None:
+        keep &= ~seen.contains(digests)
+        seen.add(digests[keep])
+    return keep
+
+
+#the columns of the raw archive RetweetLinks reads
+RETWEET_COLUMNS = ['tweet_id', 'retweeted_status_id', 'retweeted_status_user_id', 'retweeted_status_timestamp']
+
+
+class RetweetLinks:
+    #links the retweets of an archive read in chunks back to their original tweets, instead of only dropping them.
+    #add() every raw chunk before cleaning, report() once all chunks were added.
+    def __init__(self):
+        self.tweet_ids = SeenSet(np.int64)
+        self.retweets = []
+
+    def add(self, df):
+        self.tweet_ids.add(df['tweet_id'])
+        retweet = pd.notnull(df['retweeted_status_user_id']).to_numpy()
+        self.retweets.append(pd.DataFrame({
+            'tweet_id': df['tweet_id'].to_numpy(dtype=np.int64)[retweet],
+            'retweeted_status_id': df['retweeted_status_id'].to_numpy()[retweet],
+            'retweeted_status_timestamp': parse_timestamps(df['retweeted_status_timestamp'][retweet]).array}))
+
+    def report(self):
+        #every retweet with the tweet it retweets, original_in_archive tells if that tweet is in the archive
+        links = pd.concat(self.retweets, ignore_index=True) if self.retweets else \
+            pd.DataFrame({'tweet_id': np.array([], dtype=np.int64), 'retweeted_status_id': np.array([]),
+                          'retweeted_status_timestamp': pd.Series([], dtype=TIMESTAMP_DTYPE)})
+        original = links['retweeted_status_id'].to_numpy()
+        known = pd.notnull(original)
+        found = np.zeros(len(links), dtype=bool)
+        found[known] = self.tweet_ids.contains(original[known].astype(np.int64))
+        links['original_in_archive'] = found
+        return links
+
+
+def retweet_links(df):
+    #RetweetLinks.report() for a whole archive
+    links = RetweetLinks()
+    links.add(df)
+    return links.report()
+
+
+# ## Issue #1: timestamps
+#
+#the archive writes timestamps as '2017-08-01 16:23:56 +0000' and the tweet json created_at as
+#'Tue Aug 01 16:23:56 +0000 2017'. pd.to_datetime without a format infers one on every call, and with a %z
+#format it builds a tz object per value, so both layouts are rearranged byte-wise into 'YYYY-MM-DD HH:MM:SS'
+#instead, with the +0000 offset checked rather than parsed, and read by the fixed-format parser.
+#Strings in any other layout go through pd.to_datetime.
+
+TIMESTAMP_COLUMNS = ['timestamp', 'retweeted_status_timestamp', 'created_at']
+TIMESTAMP_DTYPE = pd.DatetimeTZDtype('ns', 'UTC')
+#'Jan'..'Dec' as 24-bit integers (sorted), with the month number of each
+MONTH_KEYS = np.array([ord(name[0]) << 16 | ord(name[1]) << 8 | ord(name[2]) for name in
+                       ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']])
+MONTH_ORDER = np.argsort(MONTH_KEYS)
+
+
+def iso_timestamps(values):
+    #'YYYY-MM-DD HH:MM:SS' of every string in one of the two layouts, and the mask of those strings.
+    #the strings are handled as a matrix of code points, one row per string.
+    raw = np.asarray(values, dtype='U31')
+    lengths = np.strings.str_len(raw)
+    chars = raw.view(np.uint32).reshape(len(raw), 31)
+    iso = np.zeros((len(raw), 19), dtype=np.uint32)
+
+    archive = (lengths == 25) & (chars[:, 19:25] == [ord(char) for char in ' +0000']).all(axis=1)
+    iso[archive] = chars[archive, :19]
+
+    created = (lengths == 30) & (chars[:, 19:26] == [ord(char) for char in ' +0000 ']).all(axis=1)
+    keys = chars[:, 4].astype(np.int64) << 16 | chars[:, 5].astype(np.int64) << 8 | chars[:, 6]
+    pos = np.minimum(np.searchsorted(MONTH_KEYS[MONTH_ORDER], keys), len(MONTH_KEYS) - 1)
+    created &= MONTH_KEYS[MONTH_ORDER][pos] == keys
+    month = MONTH_ORDER[pos][created] + 1
+    rows = chars[created]
+    iso[created, 0:4] = rows[:, 26:30]
+    iso[created, 4] = iso[created, 7] = ord('-')
+    iso[created, 5] = ord('0') + month // 10
+    iso[created, 6] = ord('0') + month % 10
+    iso[created, 8:10] = rows[:, 8:10]
+    iso[created, 10] = ord(' ')
+    iso[created, 11:19] = rows[:, 11:19]
+    return iso.view('U19').ravel(), archive | created
+
+
+def parse_timestamps(values):
+    #tz-aware UTC datetime64[ns] Series of a column of timestamp strings, missing or unparsable ones are NaT.
+    #every distinct string is parsed once, repeated strings reuse the result.
+    values = pd.Series(values)
+    if pd.api.types.is_datetime64_any_dtype(values.dtype):
+        times = values if isinstance(values.dtype, pd.DatetimeTZDtype) else values.dt.tz_localize('UTC')
+        return times.astype(TIMESTAMP_DTYPE)
+    codes, uniques = pd.factorize(values)
+    uniques = np.asarray(uniques, dtype=object)
+    times = np.full(len(uniques) + 1, np.datetime64('NaT'), dtype='datetime64[ns]')
+    iso, known = iso_timestamps(uniques)
+    if known.any():
+        times[:-1][known] = pd.to_datetime(iso[known], format='%Y-%m-%d %H:%M:%S',
+                                           errors='coerce').as_unit('ns').to_numpy()
+    other = np.flatnonzero(~known)
+    if len(other):
+        times[other] = pd.to_datetime(pd.Series(uniques[other]), format='mixed', utc=True,
+                                      errors='coerce').dt.tz_convert(None).dt.as_unit('ns').to_numpy()
+    #code -1 (missing) takes the NaT at the end
+    return pd.Series(pd.DatetimeIndex(times[codes]).tz_localize('UTC'), index=values.index, name=values.name)
+
+
+def normalize_timestamps(df, columns=TIMESTAMP_COLUMNS):
+    #parse the timestamp columns of df that are present, in place
+    for column in columns:
+        if column in df:
+            df[column] = parse_timestamps(df[column])
+    return df
+
+
+# ## Issue #4: source
+
+#the source column holds the html anchor of the client, e.g.
+#<a href="http://twitter.com/download/iphone" rel="nofollow">Twitter for iPhone</a>
+SOURCE_ANCHOR = re.compile(r'<a\b[^>]*>(.*?)</a>', re.IGNORECASE | re.DOTALL)
+
+#short names used in the analysis for the clients of the archive: a source value that contains a pattern,
+#href included, gets the name of the first pattern it contains. The notebook writes the names one pattern
+#after the other, and no name contains a later pattern, so there too the first match wins. Other clients
+#keep their anchor label.
+SOURCE_LABELS = [('iPhone', 'Twitter for iPhone'), ('Vine', 'Vine'), ('Web', 'Twitter for Web'),
+                 ('TweetDeck', 'TweetDeck')]
+
+
+@functools.lru_cache(maxsize=None)
+def source_label(value):
+    #client name of one source value (memoized, so every distinct anchor is parsed once per process)
+    match = SOURCE_ANCHOR.search(value)
+    label = html.unescape(match.group(1)).strip() if match else value.strip()
+    for pattern, name in SOURCE_LABELS:
+        if pattern in value:
+            return name
+    return label
+
+
+def normalize_source(source):
+    #replace the <a href=...> html anchor of the source column with the client name.
+    #only the distinct values are parsed, the labels are mapped back to the rows through the
+    #categorical codes. The result is a categorical column.
+    if isinstance(source.dtype, pd.CategoricalDtype):
+        codes, uniques = source.cat.codes.to_numpy(), source.cat.categories
+    else:
+        codes, uniques = pd.factorize(source)
+    labels = np.array([source_label(value) for value in uniques], dtype=object)
+    categories, inverse = np.unique(labels, return_inverse=True)
+    #code -1 (missing source) stays -1
+    codes = np.append(inverse, -1)[codes]
+    return pd.Series(pd.Categorical.from_codes(codes, categories=categories),
+                     index=source.index, name=source.name)
+
+
+# ## Issue #5: ratings in the text
+
+#every n/d in the text is a candidate rating, n can be a decimal (13.5/10).
+#the lookarounds keep dates and urls like 2/3/17 or t.co/1/2 out of the candidates.
+RATING_PATTERN = re.compile(r'(?<![\d/])(?<!\d\.)(?P<numerator>\d+(?:\.\d+)?)/(?P<denominator>\d+)(?![\d/])')
+
+
+def extract_ratings(text):
+    #pick the most plausible rating of every tweet from all the n/d candidates in its text:
+    #  - a denominator of 10 is the usual rating,
+    #  - a denominator that is another multiple of 10 is a group rating (80/80 for 8 dogs),
+    #  - anything else (9/11, 4/20, 50/50, 24/7) is only used when there is nothing better,
+    #and the first candidate wins between candidates of the same kind.
+    #returns a frame with rating_numerator (float), rating_denominator, the rating scaled to /10
+    #(rating) and the number of candidates; tweets without any n/d get NaN.
+    candidates = text.str.extractall(RATING_PATTERN)
+    numerator = candidates['numerator'].astype(float)
+    denominator = candidates['denominator'].astype(np.int64)
+    score = np.select([denominator == 10, (denominator % 10 == 0) & (denominator > 0), denominator > 0],
+                      [3, 2, 1], default=0)
+    ranked = pd.DataFrame({'numerator': numerator, 'denominator': denominator, 'score': score})
+    #the stable sort keeps the text order between candidates with the same score
+    ranked = ranked.sort_values('score', ascending=False, kind='stable')
+    rows = ranked.index.get_level_values(0)
+    best = ranked[~rows.duplicated()]
+    best.index = best.index.get_level_values(0)
+    ratings = pd.DataFrame({'rating_numerator': best['numerator'],
+                            'rating_denominator': best['denominator'].astype('Int64'),
+                            'rating': best['numerator'] * 10 / best['denominator'].where(best['denominator'] > 0),
+                            'candidates': pd.Series(rows).value_counts()}, index=text.index)
+    ratings['candidates'] = ratings['candidates'].fillna(0).astype(np.int64)
+    return ratings
+
+
+def rating_conflicts(df, ratings=None):
+    #rows where the rating parsed from the text differs from the stored rating_numerator/rating_denominator
+    if ratings is None:
+        ratings = extract_ratings(df['text'])
+    conflict = ((ratings['rating_numerator'] != df['rating_numerator'])
+                | (ratings['rating_denominator'] != df['rating_denominator'])).fillna(True)
+    conflicts = df.loc[conflict, ['tweet_id', 'rating_numerator', 'rating_denominator']]
+    return conflicts.join(ratings.loc[conflict, ['rating_numerator', 'rating_denominator', 'candidates']],
+                          rsuffix='_parsed')
+
+
+# ## Issue #6: dog_stage
+
+#the order of this list is the precedence used when a tweet has more than one stage set,
+#same as the old stage() method: doggo > floofer > pupper > puppo
+STAGES = ['doggo', 'floofer', 'pupper', 'puppo']
+
+
+def stage_flags(df, stages=STAGES):
+    #boolean matrix (rows x stages), True where the stage column holds its own name
+    #(the archive stores the literal string 'None' when the stage is not set)
+    return np.column_stack([df[s].to_numpy() == s for s in stages])
+
+
+def dog_stage(df, stages=STAGES):
+    #build the dog_stage column for the whole frame at once.
+    #argmax over the flags picks the first stage set in precedence order,
+    #rows without any stage get code -1 which is NaN in the Categorical.
+    flags = stage_flags(df, stages)
+    codes = np.where(flags.any(axis=1), flags.argmax(axis=1), -1)
+    return pd.Categorical.from_codes(codes, categories=stages)
+
+
+def stage_conflicts(df, stages=STAGES):
+    #return the rows that have more than one stage set, with all their stages joined
+    #by '|' (e.g. 'doggo|pupper'), so they can be reviewed instead of silently keeping the first
+    flags = stage_flags(df, stages)
+    multi = flags.sum(axis=1) > 1
+    names = np.array(stages, dtype=object)
+    all_stages = ['|'.join(names[row]) for row in flags[multi]]
+    conflicts = df.loc[multi, ['tweet_id']].copy()
+    conflicts['dog_stage'] = dog_stage(df.loc[multi], stages)
+    conflicts['all_stages'] = all_stages
+    return conflicts
+
+
+# ## Issue #10: breed_of_dog
+
+def prediction_ranks(df):
+    #ranks present in the frame, p1, p2, p3, ... (any number of them)
+    ranks = [int(c[1:]) for c in df.columns if c[:1] == 'p' and c[1:].isdigit()]
+    return sorted(ranks)
+
+
+def resolve_breed(df, min_conf=None, ranks=None):
+    #pick the breed of dog from the p{n}, p{n}_conf and p{n}_dog columns.
+    #the first rank (p1 first) that is a dog wins, same as the old extract_breed() method.
+    #with min_conf, a rank also needs p{n}_conf >= min_conf to be picked.
+    #returns a frame with the breed_of_dog and the confidence of the picked rank (breed_conf),
+    #None/NaN for images where no rank qualifies.
+    if ranks is None:
+        ranks = prediction_ranks(df)
+    labels = np.column_stack([df['p{}'.format(n)].to_numpy(dtype=object) for n in ranks])
+    conf = np.column_stack([df['p{}_conf'.format(n)].to_numpy(dtype=float) for n in ranks])
+    ok = np.column_stack([df['p{}_dog'.format(n)].to_numpy() == True for n in ranks])
+    if min_conf is not None:
+        ok &= conf >= min_conf
+    rows = np.arange(len(df))
+    first = ok.argmax(axis=1)
+    found = ok.any(axis=1)
+    return pd.DataFrame({'breed_of_dog': np.where(found, labels[rows, first], None),
+                         'breed_conf': np.where(found, conf[rows, first], np.nan)},
+                        index=df.index)
+
+
+# ## Issue #5: rating corrections
+
+#a correction table has one row per tweet_id:
+#   action 'delete' drops the tweet,
+#   action 'fix' overrides rating_numerator and/or rating_denominator (empty cells are left as they are).
+CORRECTION_ACTIONS = ['delete', 'fix']
+CORRECTED_COLUMNS = ['rating_numerator', 'rating_denominator']
+
+
+def load_corrections(path='rating_corrections.csv'):
+    #read the correction table, the last entry wins when a tweet_id is listed twice
+    corrections = pd.read_csv(path, dtype={'tweet_id': np.int64, 'action': str})
+    unknown = set(corrections['action']) - set(CORRECTION_ACTIONS)
+    if unknown:
+        raise ValueError('unknown correction action(s): {}'.format(', '.join(sorted(unknown))))
+    return corrections.drop_duplicates(subset='tweet_id', keep='last').reset_index(drop=True)
+
+
+def apply_corrections(df, corrections):
+    #apply every deletion and override in one pass over the frame.
+    #each tweet_id is looked up once in a hash index of the correction table (O(n + k) instead of
+    #one query per correction), so the table can have any number of entries.
+    #returns the corrected frame and the correction table with the number of rows each entry matched.
+    keys = corrections['tweet_id']
+    if df['tweet_id'].dtype != np.int64:
+        #tweet_id was already converted to String (Issue #2)
+        keys = keys.astype(str)
+    pos = pd.Index(keys).get_indexer(df['tweet_id'])
+    hit = pos >= 0
+
+    report = corrections.copy()
+    report['matched'] = np.bincount(pos[hit], minlength=len(corrections))
+
+    action = corrections['action'].to_numpy(dtype=object)
+    delete = np.zeros(len(df), dtype=bool)
+    delete[hit] = action[pos[hit]] == 'delete'
+    df = df[~delete].copy()
+    pos = pos[~delete]
+    hit = pos >= 0
+
+    for column in CORRECTED_COLUMNS:
+        values = corrections[column].to_numpy(dtype=float)[pos[hit]]
+        target = np.flatnonzero(hit)[~np.isnan(values)]
+        if len(target):
+            values = values[~np.isnan(values)]
+            updated = df[column].to_numpy().copy()
+            #a downcast column (see apply_schema) is widened if an override does not fit in it
+            if updated.dtype.kind in 'iu' and not (np.iinfo(updated.dtype).min <= values.min()
+                                                   and values.max() <= np.iinfo(updated.dtype).max):
+                updated = updated.astype(np.int64)
+            updated[target] = values
+            df[column] = updated
+    return df, report
+
+
+# ## Full cleaning steps
+#the plans below run Issues #1-#12 on one frame (or one chunk of a frame), in the same order as wrangle_act.py.
+#They are optimized for the columns of the frame (see planning.py), so columns that are only dropped are
+#not carried through the steps, and archive_columns() tells the readers which columns to parse at all.
+#tweet_id stays int64 through cleaning and joining, the String conversion of Issues #2, #9 and #11 is done
+#by export_master() when the master is written out.
+
+ARCHIVE_DROP_COLUMNS = ['in_reply_to_status_id', 'in_reply_to_user_id', 'retweeted_status_id',
+                        'retweeted_status_user_id', 'retweeted_status_timestamp', 'expanded_urls']
+PREDICTION_COLUMNS = ['p1', 'p1_conf', 'p1_dog', 'p2', 'p2_conf', 'p2_dog', 'p3', 'p3_conf', 'p3_dog']
+PREDICTION_DROP_COLUMNS = PREDICTION_COLUMNS + ['img_num']
+TWEET_JSON_COLUMNS = ['tweet_id', 'retweet_count', 'favorite_count']
+
+
+def archive_plan(corrections):
+    #Issues #1-#7. apply_corrections is not row-wise: its report counts the rows each correction matched
+    return (Plan('clean_archive')
+            .filter('drop_retweets', lambda df: pd.isnull(df['retweeted_status_user_id']).to_numpy(),
+                    ['retweeted_status_user_id'])
+            .cast('timestamp', parse_timestamps)
+            .cast('tweet_id', np.int64)
+            .cast('source', normalize_source)
+            .transform('apply_corrections', lambda df: apply_corrections(df, corrections),
+                       ['tweet_id'] + CORRECTED_COLUMNS, CORRECTED_COLUMNS)
+            .derive('dog_stage', dog_stage, STAGES)
+            .drop(STAGES + ARCHIVE_DROP_COLUMNS))
+
+
+def predictions_plan(seen_urls=None):
+    #Issues #8-#10, the first jpg_url depends on the rows before it
+    return (Plan('clean_predictions')
+            .filter('first_jpg_url', lambda df: first_urls(df['jpg_url'], seen_urls), ['jpg_url'], rowwise=False)
+            .cast('tweet_id', np.int64)
+            .derive(['breed_of_dog', 'breed_conf'], resolve_breed, PREDICTION_COLUMNS, name='resolve_breed')
+            .drop(PREDICTION_DROP_COLUMNS))
+
+
+def tweet_json_plan(columns=TWEET_JSON_COLUMNS):
+    #Issues #11-#12
+    plan = Plan('clean_tweet_json').rename({'id': 'tweet_id'}).select(columns).cast('tweet_id', np.int64)
+    return plan.cast('created_at', parse_timestamps) if 'created_at' in columns else plan
+
+
+def archive_columns(path, extra=()):
+    #the columns of the archive csv at path that clean_archive uses or keeps (the usecols of pd.read_csv),
+    #plus `extra` ones
+    header = pd.read_csv(path, nrows=0).columns
+    read = archive_plan(None).optimize(header).read_columns
+    return [column for column in header if column in read or column in extra]
+
+
+def clean_archive(df, corrections):
+    #Issues #1-#7 on the twitter archive, returns the clean frame and the corrections report
+    df, results = archive_plan(corrections).optimize(df.columns).execute(df)
+    return df, results['apply_corrections']
+
+
+def clean_predictions(df, seen_urls=None):
+    #Issues #8-#10 on the image predictions.
+    #seen_urls is the SeenSet of the jpg_url digests already kept from earlier chunks, it is updated in place
+    #so duplicates are dropped across chunks too (the first one is kept).
+    return predictions_plan(seen_urls).optimize(df.columns).execute(df)[0]
+
+
+def clean_tweet_json(df):
+    #Issues #11-#12 on the tweet json, only tweet_id, retweet_count and favorite_count are kept
+    #(and created_at, parsed, when it was read)
+    columns = TWEET_JSON_COLUMNS + [column for column in ['created_at'] if column in df]
+    return tweet_json_plan(columns).optimize(df.columns).execute(df)[0]
+
+
+# ## Schema
+#low-cardinality text columns are stored as categoricals and the rating/count columns as the smallest
+#integer type that holds their values. apply_schema() only touches the columns present in the frame, so it
+#can run right after ingestion and again once breed_of_dog/dog_stage have been derived.
+
+CATEGORY_COLUMNS = ['source', 'dog_stage', 'breed_of_dog', 'name']
+INTEGER_COLUMNS = ['rating_numerator', 'rating_denominator', 'retweet_count', 'favorite_count']
+
+
+def downcast_integer(column):
+    #smallest signed integer dtype that holds every value of the column, nullable (Int8, Int16, ...)
+    #when the column has missing values; columns with non integral values are returned as they are
+    values = column.dropna().to_numpy(dtype=float) if len(column) else np.array([])
+    if len(values) and not np.array_equal(values, np.floor(values)):
+        return column
+    lo, hi = (values.min(), values.max()) if len(values) else (0, 0)
+    for dtype in (np.int8, np.int16, np.int32, np.int64):
+        if np.iinfo(dtype).min <= lo and hi <= np.iinfo(dtype).max:
+            break
+    if column.isna().any():
+        return column.astype(np.dtype(dtype).name.capitalize())
+    return column.astype(dtype)
+
+
+def apply_schema(df):
+    #return df with the categorical and integer columns converted
+    changes = {}
+    for name in CATEGORY_COLUMNS:
+        if name in df.columns:
+            #categories of rows dropped by earlier steps are removed too
+            changes[name] = df[name].astype('category').cat.remove_unused_categories()
+    for name in INTEGER_COLUMNS:
+        if name in df.columns:
+            changes[name] = downcast_integer(df[name])
+    return df.assign(**changes) if changes else df
+
+
+def plain_dtypes(df):
+    #df with the dtypes pandas gives without the schema (object text, int64, float64 with missing values),
+    #to measure what apply_schema saves on frames that are already converted
+    changes = {}
+    for name, column in df.items():
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            changes[name] = column.astype(object)
+        elif isinstance(column.dtype, pd.api.extensions.ExtensionDtype) and column.dtype.kind in 'iu':
+            changes[name] = column.astype(float)
+        elif column.dtype.kind in 'iu':
+            changes[name] = column.astype(np.int64)
+    return df.assign(**changes)
+
+
+def memory_report(before, after):
+    #memory used by each column (bytes) before and after apply_schema, with a total row
+    report = pd.DataFrame({'before': before.memory_usage(deep=True, index=False),
+                           'after': after.memory_usage(deep=True, index=False)}).fillna(0).astype(np.int64)
+    report.loc['total'] = report.sum()
+    report['ratio'] = report['before'] / report['after']
+    return report
+
+
+# ## Master table
+
+def tweet_index(df):
+    #hash index of the int64 tweet_id column, built once per table and reused for every join
+    return pd.Index(df['tweet_id'].to_numpy(dtype=np.int64))
+
+
+def merge_master(archive, predictions, tweet_json, indexes=None):
+    #left join of the clean archive with the predictions and the tweet json on tweet_id, in one pass:
+    #every archive tweet_id is looked up in the index of each right table, then each right column is
+    #gathered with the positions found (missing values where there is no match) straight into the master.
+    #indexes can hold the (predictions, tweet_json) indexes from earlier calls, e.g. one per chunk.
+    #when a right table has duplicate tweet_ids it is joined with pd.merge, which repeats the rows.
+    if indexes is None:
+        indexes = (tweet_index(predictions), tweet_index(tweet_json))
+    ids = archive['tweet_id'].to_numpy(dtype=np.int64)
+    columns = {name: column.array for name, column in archive.items()}
+    merged = []
+    for right, index in zip((predictions, tweet_json), indexes):
+        if not index.is_unique:
+            merged.append(right)
+            continue
+        pos = index.get_indexer(ids)
+        for name, column in right.items():
+            if name != 'tweet_id':
+                columns[name] = pd.api.extensions.take(column.array, pos, allow_fill=True)
+    master = pd.DataFrame(columns)
+    for right in merged:
+        master = pd.merge(master, right, how='left', on=['tweet_id'])
+    return master
+
+
+#kept in memory for the analysis, but not written out: the stored master keeps the schema of the notebook
+EXPORT_DROP_COLUMNS = ['breed_conf']
+
+
+def export_master(master):
+    #the master as it is stored: tweet_id as String (Issues #2, #9, #11), without EXPORT_DROP_COLUMNS
+    master = master.drop(columns=[column for column in EXPORT_DROP_COLUMNS if column in master])
+    master['tweet_id'] = master['tweet_id'].astype(str)
+    return master
+
+
+class TimeIndex:
+    #the rows of a frame sorted by a timestamp column, so the rows of a time range are found with two binary
+    #searches instead of a comparison of every timestamp. Rows without a timestamp are left out.
+    #   index = TimeIndex(twitter_archive_master['timestamp'])
+    #   index.slice(twitter_archive_master, '2016-01-01', '2016-07-01')
+    def __init__(self, timestamps):
+        times = pd.DatetimeIndex(parse_timestamps(timestamps))
+        valid = np.flatnonzero(~times.isna())
+        #the archive is newest first, the stable sort of its reversed runs is linear
+        self.order = valid[np.argsort(times.asi8[valid], kind='stable')]
+        self.times = times[self.order]
+
+    def __len__(self):
+        return len(self.order)
+
+    def positions(self, start=None, end=None):
+        #row positions of the timestamps in [start, end), oldest first. start and end without a time zone are UTC.
+        bounds = []
+        for bound, default in ((start, 0), (end, len(self.order))):
+            if bound is None:
+                bounds.append(default)
+                continue
+            bound = pd.Timestamp(bound)
+            bound = bound.tz_localize('UTC') if bound.tzinfo is None else bound.tz_convert('UTC')
+            bounds.append(self.times.searchsorted(bound, side='left'))
+        return self.order[bounds[0]:bounds[1]]
+
+    def slice(self, df, start=None, end=None):
+        #the rows of df with a timestamp in [start, end), oldest first
+        return df.iloc[self.positions(start, end)]
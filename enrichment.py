@@ -0,0 +1,178 @@
+# coding: utf-8
+
+# Refresh of retweet_count/favorite_count for the tweets of the archive (the third gathering step), from an
+# API with a statuses/lookup style endpoint: GET <url>?id=1,2,3 answers a JSON list of the tweets found.
+#
+#   - tweet_ids are sent in batches of batch_size (100 for statuses/lookup), one request per batch;
+#   - the requests run concurrently from an asyncio loop, at most `concurrency` at a time (a semaphore),
+#     the blocking requests calls themselves run in a thread pool of the same size;
+#   - a token bucket spaces the requests to `rate` per second and follows the x-rate-limit-remaining /
+#     x-rate-limit-reset headers: when the window is used up, no request is sent before its reset;
+#   - every tweet received is appended as a json line to the checkpoint file, which has the layout of
+#     tweet-json.txt and is read with gathering.read_tweet_json. The ids the API did not return (deleted or
+#     protected tweets) go to <checkpoint>.missing. A run that stopped is resumed by running it again:
+#     the ids already in either file are skipped.
+#
+# Run with:  python wrangle.py enrich --url https://api.twitter.com/1.1/statuses/lookup.json --output tweet-json.txt
+
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from gathering import iter_tweet_json, loads
+
+LOOKUP_BATCH_SIZE = 100
+#statuses/lookup allows 900 requests per 15 minute window
+LOOKUP_RATE = 900 / (15 * 60)
+#answers retried after a pause, the other errors are raised
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    #at most `rate` acquisitions per second on average, in bursts of at most `capacity`. update() adds the
+    #rate limit window of the server: once the requests left in it are used up, no token is handed out
+    #before the window resets.
+    def __init__(self, rate, capacity=1, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+        #requests left in the window, its reset time on `clock` and the requests per window, once known
+        self.remaining = None
+        self.reset = None
+        self.limit = None
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = self.clock()
+                if self.reset is not None and now >= self.reset:
+                    self.remaining, self.reset = self.limit, None
+                if self.remaining is not None and self.remaining <= 0:
+                    await asyncio.sleep(self.reset - now if self.reset is not None else 1 / self.rate)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    if self.remaining is not None:
+                        self.remaining -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def update(self, headers):
+        #follow x-rate-limit-remaining, x-rate-limit-reset (epoch seconds) and x-rate-limit-limit of an answer
+        remaining = headers.get('x-rate-limit-remaining')
+        reset = headers.get('x-rate-limit-reset')
+        if remaining is None or reset is None:
+            return
+        if headers.get('x-rate-limit-limit') is not None:
+            self.limit = int(headers['x-rate-limit-limit'])
+        remaining = int(remaining)
+        reset = self.clock() + max(float(reset) - time.time(), 0)
+        if self.reset is None or reset > self.reset + 1e-3:
+            #the first answer of a new window
+            self.reset, self.remaining = reset, remaining
+        elif reset >= self.reset - 1e-3:
+            #answers of the same window arrive out of order, the lowest count is the latest
+            self.remaining = remaining if self.remaining is None else min(self.remaining, remaining)
+
+
+def missing_path(checkpoint):
+    return checkpoint + '.missing'
+
+
+def _repair(path):
+    #drop a last line cut short by a crash, so the file only holds complete json lines
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb+') as file:
+        data = file.read()
+        if data and not data.endswith(b'\n'):
+            file.truncate(data.rfind(b'\n') + 1)
+
+
+def done_ids(checkpoint):
+    #ids already in the checkpoint or in its .missing file
+    done = set()
+    for path in (checkpoint, missing_path(checkpoint)):
+        if os.path.exists(path):
+            _repair(path)
+            for chunk in iter_tweet_json(path, {'id': np.int64}):
+                done.update(chunk['id'].tolist())
+    return done
+
+
+def make_session(concurrency, token=None):
+    #a requests.Session with a connection pool as large as the number of concurrent requests
+    import requests
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    if token:
+        session.headers['Authorization'] = 'Bearer ' + token
+    return session
+
+
+async def _lookup(ids, url, session, bucket, semaphore, executor, retries, timeout):
+    #the tweets of one batch of ids, as a list of dicts
+    loop = asyncio.get_running_loop()
+    params = {'id': ','.join(str(tweet_id) for tweet_id in ids)}
+    async with semaphore:
+        for attempt in range(retries + 1):
+            await bucket.acquire()
+            response = await loop.run_in_executor(
+                executor, lambda: session.get(url, params=params, timeout=timeout))
+            bucket.update(response.headers)
+            if response.status_code not in RETRY_STATUS or attempt == retries:
+                break
+            if response.status_code != 429:
+                #server errors back off exponentially, a 429 waits for the reset set by update()
+                await asyncio.sleep(min(2 ** attempt, 60))
+        response.raise_for_status()
+        return loads(response.content)
+
+
+async def enrich_async(ids, url, checkpoint, batch_size=LOOKUP_BATCH_SIZE, concurrency=8, rate=LOOKUP_RATE,
+                       session=None, token=None, retries=5, timeout=30):
+    #look the ids that are not in the checkpoint yet up, returns (tweets written, ids missing)
+    done = done_ids(checkpoint)
+    ids = [int(tweet_id) for tweet_id in dict.fromkeys(ids) if int(tweet_id) not in done]
+    batches = [ids[start:start + batch_size] for start in range(0, len(ids), batch_size)]
+    session = session or make_session(concurrency, token)
+    bucket = TokenBucket(rate, capacity=min(concurrency, max(int(rate), 1)))
+    semaphore = asyncio.Semaphore(concurrency)
+    written = missing = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as executor, \
+            open(checkpoint, 'a') as tweets_file, open(missing_path(checkpoint), 'a') as missing_file:
+        tasks = [asyncio.ensure_future(_lookup(batch, url, session, bucket, semaphore, executor, retries, timeout))
+                 for batch in batches]
+        try:
+            for batch, task in zip(batches, tasks):
+                tweets = await task
+                #a batch is written whole and flushed before the next one, the loop writes from a single thread
+                found = {tweet['id'] for tweet in tweets}
+                tweets_file.writelines(json.dumps(tweet) + '\n' for tweet in tweets)
+                lost = [tweet_id for tweet_id in batch if tweet_id not in found]
+                missing_file.writelines(json.dumps({'id': tweet_id}) + '\n' for tweet_id in lost)
+                tweets_file.flush()
+                missing_file.flush()
+                written += len(tweets)
+                missing += len(lost)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    return written, missing
+
+
+def enrich(ids, url, checkpoint='tweet-json.txt', **options):
+    #enrich_async from synchronous code
+    return asyncio.run(enrich_async(ids, url, checkpoint, **options))
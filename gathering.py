@@ -0,0 +1,230 @@
+# coding: utf-8
+
+# Readers for the gathered data used by the pipelines.
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from cleaning import url_digests
+from storing import PREDICTION_COLUMNS, prediction_types
+
+try:
+    #orjson is a lot faster than the standard json module, it is used when installed
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
+
+
+# ## image_predictions.tsv
+
+IMAGE_PREDICTIONS_URL = ('https://d17h27t6h515a5.cloudfront.net/topher/2017/August/'
+                         '599fd2ad_image-predictions/image-predictions.tsv')
+
+_session = None
+
+
+def get_session():
+    #one pooled requests.Session shared by every download
+    global _session
+    if _session is None:
+        import requests
+        _session = requests.Session()
+    return _session
+
+
+def _read_meta(path):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def fetch(url, path, session=None, chunk_size=1 << 16, timeout=60):
+    #download url to path, streaming the body to disk in chunks.
+    #  - the ETag and Last-Modified of the last download are kept in <path>.meta and sent back as
+    #    If-None-Match / If-Modified-Since, so an unchanged file is not downloaded again;
+    #  - the body is written to <path>.part and only renamed to path when complete, an interrupted
+    #    download is resumed from the end of <path>.part with a Range request (a 200 answer to it means the
+    #    file changed and is downloaded again from the start, a 416 that the part is of no use).
+    #returns True when path was (re)written, False when the server said it has not changed.
+    session = session or get_session()
+    meta_path = path + '.meta'
+    part_path = path + '.part'
+    meta = _read_meta(meta_path)
+
+    headers = {}
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    if offset:
+        #resume, but only if the file on the server is still the one the part came from: If-Range is its ETag,
+        #or its Last-Modified date when the server sent no ETag
+        headers['Range'] = 'bytes={}-'.format(offset)
+        if meta.get('part_etag') or meta.get('part_last_modified'):
+            headers['If-Range'] = meta.get('part_etag') or meta['part_last_modified']
+    elif os.path.exists(path):
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+
+    with session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+        if response.status_code == 304:
+            return False
+        if response.status_code == 416:
+            #the part file does not fit the file on the server any more, start over
+            os.remove(part_path)
+            return fetch(url, path, session, chunk_size, timeout)
+        response.raise_for_status()
+        #the validators of the file being downloaded are kept apart from those of the complete file
+        #until the download finishes
+        meta['part_etag'] = response.headers.get('ETag')
+        meta['part_last_modified'] = response.headers.get('Last-Modified')
+        with open(meta_path, 'w') as file:
+            json.dump(meta, file)
+        #a 200 answer to a Range request means the server sent the whole file
+        with open(part_path, 'ab' if response.status_code == 206 else 'wb') as file:
+            for data in response.iter_content(chunk_size):
+                file.write(data)
+
+    os.replace(part_path, path)
+    meta = {'etag': meta.pop('part_etag'), 'last_modified': meta.pop('part_last_modified')}
+    with open(meta_path, 'w') as file:
+        json.dump(meta, file)
+    return True
+
+
+_predictions = None
+
+
+def fetch_image_predictions(path='image_predictions.tsv', url=IMAGE_PREDICTIONS_URL, session=None):
+    #download image_predictions.tsv when it changed on the server, and read it
+    #(the frame is only parsed again when the file was rewritten or has not been read yet)
+    global _predictions
+    changed = fetch(url, path, session)
+    key = (os.path.abspath(path), os.path.getmtime(path))
+    if changed or _predictions is None or _predictions[0] != key:
+        _predictions = (key, pd.read_csv(path, sep='\t'))
+    return _predictions[1].copy()
+
+
+def predict_images(images, classify, cache=None):
+    #image predictions of images (tweet_id, jpg_url, img_num) in the layout of image_predictions.tsv.
+    #classify(urls) returns a frame with the PREDICTION_COLUMNS of a list of jpg_url, row for row. It is only
+    #called for the distinct urls missing from the cache (a storing.PredictionCache), which then stores them,
+    #so an image shared by several tweets or classified by an earlier run is not classified again.
+    digests = url_digests(images['jpg_url'])
+    unique, first = np.unique(digests, return_index=True)
+    found = cache.get(unique) if cache is not None else pd.DataFrame(columns=PREDICTION_COLUMNS)
+    missing = ~np.isin(unique, found.index.to_numpy(dtype=np.uint64))
+    computed = found.iloc[:0]
+    if missing.any():
+        urls = images['jpg_url'].to_numpy(dtype=object)[first[missing]]
+        computed = prediction_types(classify(list(urls))[PREDICTION_COLUMNS]).set_axis(unique[missing])
+        if cache is not None:
+            cache.put(unique[missing], computed)
+    known = pd.concat([found, computed]) if len(found) else computed
+    rows = known.index.get_indexer(digests)
+    predictions = images[['tweet_id', 'jpg_url', 'img_num']].reset_index(drop=True)
+    for column in PREDICTION_COLUMNS:
+        predictions[column] = known[column].to_numpy()[rows]
+    return predictions
+
+
+def cache_predictions(predictions, cache):
+    #store the predictions of a frame laid out like image_predictions.tsv in a storing.PredictionCache
+    cache.put(url_digests(predictions['jpg_url']), predictions)
+    return cache
+
+
+# ## tweet-json.txt
+
+#the only fields of the tweet json the master needs (Issue #12), with their dtypes
+TWEET_JSON_FIELDS = {'id': np.int64, 'retweet_count': np.int64, 'favorite_count': np.int64}
+
+
+def _field_getter(field):
+    #'user.followers_count' reads a nested key
+    keys = field.split('.')
+    if len(keys) == 1:
+        return lambda tweet: tweet.get(field)
+
+    def get(tweet):
+        for key in keys:
+            if not isinstance(tweet, dict):
+                return None
+            tweet = tweet.get(key)
+        return tweet
+    return get
+
+
+def _column(values, missing, dtype):
+    #integer columns with missing values become nullable Int64
+    if missing.any() and np.issubdtype(dtype, np.integer):
+        return pd.arrays.IntegerArray(values.astype(np.int64), missing)
+    if missing.any() and np.issubdtype(dtype, np.floating):
+        values[missing] = np.nan
+    return values
+
+
+def iter_tweet_json(path, fields=TWEET_JSON_FIELDS, chunksize=100000):
+    #parse tweet-json.txt line by line and yield frames of at most `chunksize` rows
+    #holding only the requested fields, written straight into preallocated typed arrays.
+    #none of the other fields (entities, retweeted_status, ...) are turned into python objects
+    #beyond what the json parser builds for the line.
+    names = list(fields)
+    getters = [_field_getter(name) for name in names]
+    #text fields are kept as python str objects
+    dtypes = [np.dtype(object) if np.dtype(fields[name]).kind in 'OUS' else np.dtype(fields[name])
+              for name in names]
+
+    def allocate():
+        return ([np.zeros(chunksize, dtype=dtype) if dtype != object else np.empty(chunksize, dtype=object)
+                 for dtype in dtypes],
+                [np.zeros(chunksize, dtype=bool) for _ in names])
+
+    def frame(arrays, missing, size):
+        return pd.DataFrame({name: _column(values[:size], miss[:size], dtype)
+                             for name, values, miss, dtype in zip(names, arrays, missing, dtypes)})
+
+    arrays, missing = allocate()
+    size = 0
+    with open(path, 'rb') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            tweet = loads(line)
+            for values, miss, get in zip(arrays, missing, getters):
+                value = get(tweet)
+                if value is None:
+                    miss[size] = True
+                else:
+                    values[size] = value
+            size += 1
+            if size == chunksize:
+                yield frame(arrays, missing, size)
+                arrays, missing = allocate()
+                size = 0
+    if size:
+        yield frame(arrays, missing, size)
+
+
+def count_lines(path, block=1 << 20):
+    #number of lines in a file, read in 1MB blocks
+    lines = 0
+    with open(path, 'rb') as file:
+        for data in iter(lambda: file.read(block), b''):
+            lines += data.count(b'\n')
+    return lines
+
+
+def read_tweet_json(path='tweet-json.txt', fields=TWEET_JSON_FIELDS):
+    #read the whole tweet json with only the requested fields.
+    #the arrays are sized from the line count, so they are allocated once.
+    chunks = list(iter_tweet_json(path, fields, chunksize=max(count_lines(path) + 1, 1)))
+    if not chunks:
+        return pd.DataFrame({name: np.array([], dtype=dtype) for name, dtype in fields.items()})
+    return chunks[0]
@@ -0,0 +1,113 @@
+# coding: utf-8
+
+# Timing and memory of the named stages of a pipeline run.
+#
+#   stages = Stages()
+#   with stages.stage('read_archive') as info:
+#       archive = pd.read_csv(ARCHIVE_PATH)
+#       info['rows_out'] = len(archive)
+#   stages.write_json('stages.json')
+#
+# Every stage records wall time, CPU time, the peak RSS of the process after it ran and how much the stage
+# raised it, and the rows in/out when they are given. With trace_memory=True the peak of python allocations
+# during the stage (tracemalloc) is recorded too; it slows allocation-heavy code down, so it is off by default.
+# A stage run several times (e.g. once per chunk) is accumulated under its name.
+
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def peak_rss():
+    #peak resident set size of the process in bytes, None where it is not available
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def frame_rows(value):
+    #number of rows of a frame, or of the first frame of a tuple (e.g. clean_archive's (frame, report))
+    if isinstance(value, tuple) and value:
+        value = value[0]
+    return len(value) if hasattr(value, 'shape') else None
+
+
+class Stages:
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.records = {}
+        self.started = time.time()
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        #time the body of the with block as stage `name`, the yielded dict takes rows_out
+        info = {'rows_in': rows_in, 'rows_out': None}
+        rss_before = peak_rss()
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            traced_before = tracemalloc.get_traced_memory()[0]
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield info
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            record = self.records.setdefault(name, {
+                'stage': name, 'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0, 'peak_rss_bytes': None,
+                'rss_growth_bytes': None, 'traced_peak_bytes': None, 'rows_in': None, 'rows_out': None})
+            record['calls'] += 1
+            record['wall_s'] += wall
+            record['cpu_s'] += cpu
+            rss_after = peak_rss()
+            if rss_after is not None:
+                record['peak_rss_bytes'] = rss_after
+                record['rss_growth_bytes'] = (record['rss_growth_bytes'] or 0) + rss_after - rss_before
+            if self.trace_memory:
+                traced = tracemalloc.get_traced_memory()[1] - traced_before
+                record['traced_peak_bytes'] = max(record['traced_peak_bytes'] or 0, traced)
+            for key in ('rows_in', 'rows_out'):
+                if info[key] is not None:
+                    record[key] = (record[key] or 0) + info[key]
+
+    def run(self, name, func, *args, **kwargs):
+        #call func as stage `name`, the rows in/out are taken from the first argument and the result
+        with self.stage(name, frame_rows(args[0]) if args else None) as info:
+            result = func(*args, **kwargs)
+            info['rows_out'] = frame_rows(result)
+        return result
+
+    def iterate(self, name, iterable):
+        #yield the items of iterable, timing the production of every item (e.g. reading a chunk) as stage `name`
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name) as info:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                info['rows_out'] = frame_rows(item)
+            yield item
+
+    def report(self):
+        #machine-readable report of the run, stages in the order they first ran
+        return {'started': self.started,
+                'python': platform.python_version(),
+                'pid': os.getpid(),
+                'total_wall_s': sum(record['wall_s'] for record in self.records.values()),
+                'stages': list(self.records.values())}
+
+    def write_json(self, path):
+        with open(path, 'w') as file:
+            json.dump(self.report(), file, indent=2)
@@ -0,0 +1,480 @@
+# coding: utf-8
+
+# Pipelines that run the cleaning steps of wrangle_act.py (Issues #1-#12) outside of the notebook.
+#
+# Streaming mode reads the three sources in chunks of `chunksize` rows, so the raw frames are never
+# held in memory at once: the image predictions and the tweet json are cleaned chunk by chunk down
+# to the few columns the master needs (the lookup tables), then every chunk of the archive is
+# cleaned, merged with them on tweet_id and appended to twitter_archive_master.csv.
+#
+# Every mode also writes the breed/dog_stage/source aggregates of the master (analysis.Aggregates) to
+# <master>.aggregates, the streaming build summarizes every chunk and merges it into them.
+#
+# In-memory mode builds the four clean frames at once and can keep them in a FrameCache, so a run
+# with unchanged inputs and cleaning code loads them back instead of cleaning again.
+#
+# Run with:  python pipeline.py --chunksize 100000
+#            python pipeline.py --cache-dir .wrangle_cache
+#            python pipeline.py --append
+#            python pipeline.py --workers 4
+#            python pipeline.py --cache-dir .wrangle_cache --binary
+
+import argparse
+import json
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+import cleaning
+import gathering
+import planning
+from analysis import Aggregates
+from cleaning import (RETWEET_COLUMNS, RetweetLinks, SeenSet, TimeIndex, apply_schema, archive_columns,
+                      clean_archive, clean_predictions, clean_tweet_json, export_master, first_urls,
+                      load_corrections, memory_report, merge_master, plain_dtypes, tweet_index)
+from gathering import TWEET_JSON_FIELDS, iter_tweet_json, read_tweet_json
+from instrumentation import Stages
+from storing import FrameCache, cache_key, load_frame, save_frame, write_binary
+
+ARCHIVE_PATH = 'twitter-archive-enhanced.csv'
+PREDICTIONS_PATH = 'image_predictions.tsv'
+TWEET_JSON_PATH = 'tweet-json.txt'
+CORRECTIONS_PATH = 'rating_corrections.csv'
+MASTER_PATH = 'twitter_archive_master.csv'
+
+#count columns are kept as nullable integers so every chunk is written the same way,
+#whether or not the chunk has tweets missing from tweet-json.txt
+COUNT_COLUMNS = ['retweet_count', 'favorite_count']
+#how DataFrame.to_csv writes a missing value
+NA_REP = ''
+
+
+# ## Chunked readers
+
+#every chunk goes through apply_schema as soon as it is read
+
+def read_archive_chunks(path=ARCHIVE_PATH, chunksize=100000, usecols=None):
+    return (apply_schema(chunk) for chunk in pd.read_csv(path, chunksize=chunksize, usecols=usecols))
+
+
+def read_predictions_chunks(path=PREDICTIONS_PATH, chunksize=100000):
+    return (apply_schema(chunk) for chunk in pd.read_csv(path, sep='\t', chunksize=chunksize))
+
+
+def read_tweet_json_chunks(path=TWEET_JSON_PATH, chunksize=100000):
+    #only id, retweet_count and favorite_count are parsed (Issue #12)
+    return (apply_schema(chunk) for chunk in iter_tweet_json(path, TWEET_JSON_FIELDS, chunksize))
+
+
+# ## Streaming build
+
+def clean_predictions_streaming(chunks, stages=None):
+    #clean image prediction chunks, jpg_url duplicates are dropped across chunk boundaries
+    stages = stages or Stages()
+    seen_urls = SeenSet()
+    return apply_schema(pd.concat([stages.run('clean_predictions', clean_predictions, chunk, seen_urls)
+                                   for chunk in stages.iterate('read_predictions', chunks)], ignore_index=True))
+
+
+def clean_tweet_json_streaming(chunks, stages=None):
+    stages = stages or Stages()
+    return apply_schema(pd.concat([stages.run('clean_tweet_json', clean_tweet_json, chunk)
+                                   for chunk in stages.iterate('read_tweet_json', chunks)], ignore_index=True))
+
+
+def write_master_chunks(archive_chunks, corrections, predictions, tweet_json, output_path, start=0, stages=None,
+                        retweets=None, aggregates=None):
+    #clean every archive chunk, join it with the predictions and tweet json and write it to output_path,
+    #appending after `start` rows already in the file (start=0 writes a new file with the header).
+    #the raw chunks are added to `retweets` (a RetweetLinks) when given, before the retweets are dropped,
+    #and the master chunks to `aggregates` (an Aggregates) when given.
+    #returns the number of rows written, the corrections report summed over the chunks and the highest tweet_id.
+    stages = stages or Stages()
+    #the right tables are indexed once, every archive chunk is joined against the same indexes
+    with stages.stage('index_lookups'):
+        indexes = (tweet_index(predictions), tweet_index(tweet_json))
+    written = 0
+    report = None
+    high_water_mark = None
+    for chunk in stages.iterate('read_archive', archive_chunks):
+        if retweets is not None:
+            with stages.stage('link_retweets', len(chunk)):
+                retweets.add(chunk)
+        archive, chunk_report = stages.run('clean_archive', clean_archive, chunk, corrections)
+        report = chunk_report if report is None else report.assign(
+            matched=report['matched'] + chunk_report['matched'])
+        if len(archive):
+            chunk_max = int(archive['tweet_id'].max())
+            high_water_mark = chunk_max if high_water_mark is None else max(high_water_mark, chunk_max)
+        master = stages.run('merge_master', merge_master, archive, predictions, tweet_json, indexes)
+        if aggregates is not None:
+            with stages.stage('aggregate_master', len(master)):
+                aggregates.add(master)
+        with stages.stage('write_master', len(master)):
+            master = export_master(master)
+            for column in COUNT_COLUMNS:
+                master[column] = master[column].astype('Int64')
+            #same running index as the in-memory master written with index=True
+            index = start + written
+            master.index = pd.RangeIndex(index, index + len(master))
+            master.to_csv(output_path, mode='w' if index == 0 else 'a', header=index == 0, index=True, na_rep=NA_REP)
+        written += len(master)
+    return written, report, high_water_mark
+
+
+def build_master_streaming(archive_path=ARCHIVE_PATH, predictions_path=PREDICTIONS_PATH,
+                           tweet_json_path=TWEET_JSON_PATH, corrections_path=CORRECTIONS_PATH,
+                           output_path=MASTER_PATH, chunksize=100000, stages=None, retweets=None):
+    #build twitter_archive_master.csv chunk by chunk.
+    #returns the number of rows written and the corrections report summed over all chunks.
+    #the retweets dropped on the way are linked to their originals in `retweets` (a RetweetLinks) when given.
+    stages = stages or Stages()
+    aggregates = Aggregates()
+    corrections = load_corrections(corrections_path)
+    predictions = clean_predictions_streaming(read_predictions_chunks(predictions_path, chunksize), stages)
+    tweet_json = clean_tweet_json_streaming(read_tweet_json_chunks(tweet_json_path, chunksize), stages)
+    written, report, high_water_mark = write_master_chunks(
+        read_archive_chunks(archive_path, chunksize,
+                            archive_columns(archive_path, RETWEET_COLUMNS if retweets is not None else ())),
+        corrections, predictions, tweet_json, output_path,
+        stages=stages, retweets=retweets, aggregates=aggregates)
+    write_master_state(output_path, {'rows': written, 'high_water_mark': high_water_mark})
+    aggregates.save(master_aggregates_path(output_path))
+    return written, report
+
+
+# ## Incremental append
+#
+# tweet_ids grow with time, so the highest tweet_id in the master (the high-water mark) separates the
+# tweets already stored from the new ones. It is kept with the row count in <master>.state, so an append
+# does not read the master back to find it. An append:
+#   - updates retweet_count/favorite_count of the stored tweets from tweet-json.txt (the master is
+#     rewritten chunk by chunk, and only when a count changed),
+#   - cleans only the archive rows above the high-water mark and appends them to the master.
+# The counts of stored tweets can change, so the aggregates of the stored rows are summarized again while
+# update_master_counts rewrites them (the master is read once either way) and merged with the appended rows.
+
+def master_state_path(master_path):
+    return master_path + '.state'
+
+
+def master_aggregates_path(master_path):
+    return master_path + '.aggregates'
+
+
+def write_master_state(master_path, state):
+    with open(master_state_path(master_path), 'w') as file:
+        json.dump(state, file)
+
+
+def master_state(master):
+    #the state of a master built in memory, written with it so a later append starts after its tweets
+    return {'rows': len(master), 'high_water_mark': int(master['tweet_id'].max()) if len(master) else None}
+
+
+def read_master_state(master_path, chunksize=100000):
+    #rows and high_water_mark of the master, from <master>.state or, if it is missing, from the master itself
+    try:
+        with open(master_state_path(master_path)) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        pass
+    rows = 0
+    high_water_mark = None
+    for chunk in pd.read_csv(master_path, usecols=['tweet_id'], chunksize=chunksize):
+        rows += len(chunk)
+        if len(chunk):
+            chunk_max = int(chunk['tweet_id'].max())
+            high_water_mark = chunk_max if high_water_mark is None else max(high_water_mark, chunk_max)
+    return {'rows': rows, 'high_water_mark': high_water_mark}
+
+
+def update_master_counts(master_path, tweet_json, chunksize=100000, aggregates=None):
+    #upsert retweet_count/favorite_count of the stored tweets, returns the number of rows updated.
+    #every cell is read back as text, so only the updated counts change in the rewritten file.
+    #the updated rows are added to `aggregates` (an Aggregates) when given.
+    index = tweet_index(tweet_json)
+    updated = 0
+    partial = master_path + '.partial'
+    first = True
+    for chunk in pd.read_csv(master_path, index_col=0, dtype=str, keep_default_na=False, chunksize=chunksize):
+        pos = index.get_indexer(chunk['tweet_id'].astype(np.int64))
+        found = pos >= 0
+        changed = np.zeros(len(chunk), dtype=bool)
+        for column in COUNT_COLUMNS:
+            #formatted as the writer formats them, a missing count is NA_REP and not '<NA>'
+            counts = tweet_json[column].astype('Int64')
+            counts = counts.astype(str).where(counts.notna(), NA_REP).to_numpy()[pos[found]]
+            stored = chunk[column].to_numpy()
+            changed[found] |= stored[found] != counts
+            stored = stored.copy()
+            stored[found] = counts
+            chunk[column] = stored
+        updated += int(changed.sum())
+        if aggregates is not None:
+            #empty cells are the missing keys and values
+            typed = chunk[aggregates.keys].replace('', np.nan)
+            for column in aggregates.values:
+                typed[column] = pd.to_numeric(chunk[column].replace('', np.nan))
+            aggregates.add(typed)
+        chunk.to_csv(partial, mode='w' if first else 'a', header=first, index=True, na_rep=NA_REP)
+        first = False
+    if updated:
+        os.replace(partial, master_path)
+    else:
+        os.remove(partial)
+    return updated
+
+
+def append_master(archive_path=ARCHIVE_PATH, predictions_path=PREDICTIONS_PATH,
+                  tweet_json_path=TWEET_JSON_PATH, corrections_path=CORRECTIONS_PATH,
+                  master_path=MASTER_PATH, chunksize=100000, stages=None):
+    #bring an existing twitter_archive_master.csv up to date (it is built from scratch if missing).
+    #returns the number of rows appended and the number of stored rows whose counts were updated.
+    stages = stages or Stages()
+    if not os.path.exists(master_path):
+        written, _ = build_master_streaming(archive_path, predictions_path, tweet_json_path,
+                                            corrections_path, master_path, chunksize, stages)
+        return written, 0
+    with stages.stage('read_master_state'):
+        state = read_master_state(master_path, chunksize)
+    high_water_mark = state['high_water_mark'] if state['high_water_mark'] is not None else -1
+
+    tweet_json = clean_tweet_json_streaming(read_tweet_json_chunks(tweet_json_path, chunksize), stages)
+    aggregates = Aggregates()
+    with stages.stage('update_master_counts', state['rows']) as info:
+        updated = update_master_counts(master_path, tweet_json, chunksize, aggregates)
+        info['rows_out'] = updated
+
+    #jpg_url duplicates are still checked against the predictions of the stored tweets
+    seen_urls = SeenSet()
+    predictions = (stages.run('clean_predictions', clean_predictions, chunk, seen_urls)
+                   for chunk in stages.iterate('read_predictions',
+                                               read_predictions_chunks(predictions_path, chunksize)))
+    predictions = apply_schema(pd.concat([chunk[chunk['tweet_id'] > high_water_mark] for chunk in predictions],
+                                         ignore_index=True))
+    new_rows = (chunk[chunk['tweet_id'] > high_water_mark]
+                for chunk in read_archive_chunks(archive_path, chunksize, archive_columns(archive_path)))
+    written, _, chunk_max = write_master_chunks(new_rows, load_corrections(corrections_path),
+                                                predictions, tweet_json, master_path, start=state['rows'],
+                                                stages=stages, aggregates=aggregates)
+    if chunk_max is not None:
+        high_water_mark = max(high_water_mark, chunk_max)
+    write_master_state(master_path, {'rows': state['rows'] + written,
+                                     'high_water_mark': None if high_water_mark < 0 else high_water_mark})
+    aggregates.save(master_aggregates_path(master_path))
+    return written, updated
+
+
+# ## In-memory build
+
+#the code the clean frames depend on, part of every cache key: the cleaning steps and their composition here
+CODE_PATHS = [__file__, cleaning.__file__, gathering.__file__, planning.__file__]
+
+
+def build_frames(archive_path=ARCHIVE_PATH, predictions_path=PREDICTIONS_PATH,
+                 tweet_json_path=TWEET_JSON_PATH, corrections_path=CORRECTIONS_PATH, cache=None, stages=None,
+                 master=True, indexes=None):
+    #build twitter_archive_clean, image_predictions_clean, tweet_json_clean and twitter_archive_master
+    #(with master=False, only the three clean frames).
+    #indexes, a dict, gets the TimeIndex of the master under 'twitter_archive_master', built with the master so
+    #its time-range queries (TimeIndex.slice) do not compare every timestamp.
+    #with a FrameCache, each frame is keyed by its own inputs plus the cleaning code.
+    #every read/clean/merge step is timed as a stage of `stages`.
+    stages = stages or Stages()
+
+    def step(name, inputs, build):
+        if cache is None:
+            return build()
+        with stages.stage('cache_' + name):
+            key = cache_key(*inputs, *CODE_PATHS)
+            df = cache.get(name, key)
+        if df is None:
+            df = build()
+            with stages.stage('cache_put_' + name):
+                cache.put(name, key, df)
+        return df
+
+    def clean_archive_frame():
+        raw = stages.run('read_archive',
+                         lambda: apply_schema(pd.read_csv(archive_path, usecols=archive_columns(archive_path))))
+        corrections = load_corrections(corrections_path)
+        return stages.run('clean_archive', lambda df: apply_schema(clean_archive(df, corrections)[0]), raw)
+
+    def clean_predictions_frame():
+        raw = stages.run('read_predictions', lambda: apply_schema(pd.read_csv(predictions_path, sep='\t')))
+        return stages.run('clean_predictions', lambda df: apply_schema(clean_predictions(df)), raw)
+
+    def clean_tweet_json_frame():
+        raw = stages.run('read_tweet_json',
+                         lambda: apply_schema(read_tweet_json(tweet_json_path, TWEET_JSON_FIELDS)))
+        return stages.run('clean_tweet_json', lambda df: apply_schema(clean_tweet_json(df)), raw)
+
+    #apply_schema runs right after each source is read, and again on the clean frames for the derived columns
+    frames = {}
+    frames['twitter_archive_clean'] = step(
+        'twitter_archive_clean', [archive_path, corrections_path], clean_archive_frame)
+    frames['image_predictions_clean'] = step(
+        'image_predictions_clean', [predictions_path], clean_predictions_frame)
+    frames['tweet_json_clean'] = step(
+        'tweet_json_clean', [tweet_json_path], clean_tweet_json_frame)
+    if not master:
+        return frames
+    frames['twitter_archive_master'] = step(
+        'twitter_archive_master', [archive_path, corrections_path, predictions_path, tweet_json_path],
+        lambda: stages.run('merge_master', lambda a, p, t: apply_schema(merge_master(a, p, t)),
+                           frames['twitter_archive_clean'], frames['image_predictions_clean'],
+                           frames['tweet_json_clean']))
+    if indexes is not None:
+        indexes['twitter_archive_master'] = stages.run('time_index', TimeIndex,
+                                                       frames['twitter_archive_master']['timestamp'])
+    return frames
+
+
+# ## Parallel build
+#
+# The sources are hash-partitioned on tweet_id, so every partition holds all the rows of its tweets in the
+# three sources and can be cleaned and joined on its own in a worker process. The partitions are handed over
+# as memory-mapped column files (storing.save_frame) in a temporary directory instead of being pickled
+# to the workers, and the workers write their part of the master back the same way.
+# jpg_url duplicates (Issue #8) can belong to different tweets, they are dropped before partitioning.
+# Measured with python benchmark.py --rows 20000 --workers 2 on a machine with one CPU: 0.71s with one worker,
+# 0.91s with two, the pool start and the partition files cost more than the second process saves there.
+# More workers than cores only pay off, if at all, on inputs much larger than the notebook's.
+
+def partition_ids(ids, partitions):
+    #partition number of every tweet_id. tweet_id is hashed first because its low bits are mostly
+    #a sequence number and would not spread evenly.
+    return (pd.util.hash_array(np.asarray(ids, dtype=np.int64)) % np.uint64(partitions)).astype(np.int64)
+
+
+def _clean_partition(directory, corrections):
+    #worker: clean and join the three sources of one partition, same steps as build_frames
+    archive = load_frame(os.path.join(directory, 'archive'))
+    predictions = load_frame(os.path.join(directory, 'predictions'))
+    tweet_json = load_frame(os.path.join(directory, 'tweet_json'))
+    archive, report = clean_archive(apply_schema(archive), corrections)
+    master = merge_master(apply_schema(archive), apply_schema(clean_predictions(apply_schema(predictions))),
+                          apply_schema(clean_tweet_json(apply_schema(tweet_json))))
+    save_frame(master, os.path.join(directory, 'master'))
+    return report
+
+
+def build_master_parallel(archive_path=ARCHIVE_PATH, predictions_path=PREDICTIONS_PATH,
+                          tweet_json_path=TWEET_JSON_PATH, corrections_path=CORRECTIONS_PATH,
+                          workers=None, partitions=None, stages=None):
+    #the twitter_archive_master of build_frames, cleaned in `partitions` partitions (one per worker by default)
+    #by a pool of `workers` processes. Returns the master and the corrections report.
+    stages = stages or Stages()
+    workers = workers or os.cpu_count()
+    partitions = partitions or workers
+    corrections = load_corrections(corrections_path)
+    archive = stages.run('read_archive', pd.read_csv, archive_path, usecols=archive_columns(archive_path))
+    #the archive row order is kept in _row, so the partitions can be put back in the serial order
+    archive['_row'] = np.arange(len(archive))
+    predictions = stages.run('read_predictions', pd.read_csv, predictions_path, sep='\t')
+    predictions = stages.run('drop_duplicate_jpg_url', lambda df: df[first_urls(df['jpg_url'])], predictions)
+    tweet_json = stages.run('read_tweet_json', read_tweet_json, tweet_json_path, TWEET_JSON_FIELDS)
+    sources = {'archive': (archive, archive['tweet_id']),
+               'predictions': (predictions, predictions['tweet_id']),
+               'tweet_json': (tweet_json, tweet_json['id'])}
+
+    with tempfile.TemporaryDirectory(prefix='wrangle-') as workdir:
+        directories = [os.path.join(workdir, str(part)) for part in range(partitions)]
+        with stages.stage('partition'):
+            for name, (df, ids) in sources.items():
+                part = partition_ids(ids, partitions)
+                for number, directory in enumerate(directories):
+                    save_frame(df[part == number].reset_index(drop=True), os.path.join(directory, name))
+        del sources, archive, predictions, tweet_json
+
+        #the workers are timed as a whole, their own stages run in other processes
+        with stages.stage('clean_partitions'):
+            if workers == 1:
+                reports = [_clean_partition(directory, corrections) for directory in directories]
+            else:
+                #multiprocessing is only imported by the runs that use it
+                from concurrent.futures import ProcessPoolExecutor
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    reports = list(pool.map(_clean_partition, directories, [corrections] * partitions))
+        master = stages.run('gather_partitions', lambda: pd.concat(
+            [load_frame(os.path.join(directory, 'master')) for directory in directories], ignore_index=True))
+
+    master = stages.run('restore_order', lambda df: df.sort_values('_row', kind='stable').drop(columns='_row')
+                        .reset_index(drop=True), master)
+    report = reports[0].assign(matched=sum(report['matched'] for report in reports))
+    return stages.run('apply_schema', apply_schema, master), report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='build twitter_archive_master.csv in chunks')
+    parser.add_argument('--chunksize', type=int, default=100000)
+    parser.add_argument('--archive', default=ARCHIVE_PATH)
+    parser.add_argument('--predictions', default=PREDICTIONS_PATH)
+    parser.add_argument('--tweet-json', default=TWEET_JSON_PATH)
+    parser.add_argument('--corrections', default=CORRECTIONS_PATH)
+    parser.add_argument('--output', default=MASTER_PATH)
+    parser.add_argument('--cache-dir', help='build in memory and cache the clean frames in this directory')
+    parser.add_argument('--cache-size', type=int, default=1 << 30, help='cache size limit in bytes')
+    parser.add_argument('--append', action='store_true',
+                        help='append the tweets newer than the stored master and update its counts')
+    parser.add_argument('--workers', type=int, help='build in memory with this many worker processes')
+    parser.add_argument('--report', help='write the timing and memory of every stage to this JSON file')
+    parser.add_argument('--trace-memory', action='store_true', help='record python allocations per stage')
+    parser.add_argument('--binary', action='store_true',
+                        help='also write the master typed next to --output (parquet and feather with pyarrow, '
+                             'memory-mapped .npy files without); needs --workers or --cache-dir')
+    args = parser.parse_args(argv)
+    if args.binary and not (args.workers or args.cache_dir):
+        parser.error('--binary needs the master in memory, use --workers or --cache-dir')
+    stages = Stages(trace_memory=args.trace_memory)
+    if args.workers:
+        master, report = build_master_parallel(args.archive, args.predictions, args.tweet_json, args.corrections,
+                                               args.workers, stages=stages)
+        with stages.stage('write_master', len(master)):
+            export_master(master).to_csv(args.output, index=True)
+        if args.binary:
+            with stages.stage('write_binary', len(master)):
+                written = write_binary(export_master(master), args.output)
+            print('master written to {}'.format(', '.join(written)))
+        write_master_state(args.output, master_state(master))
+        with stages.stage('aggregate_master', len(master)):
+            Aggregates.from_frame(master).save(master_aggregates_path(args.output))
+        print('{} rows written to {} by {} workers'.format(len(master), args.output, args.workers))
+    elif args.append:
+        written, updated = append_master(args.archive, args.predictions, args.tweet_json, args.corrections,
+                                         args.output, args.chunksize, stages)
+        print('{} rows appended to {}, {} rows with updated counts'.format(written, args.output, updated))
+    elif args.cache_dir:
+        frames = build_frames(args.archive, args.predictions, args.tweet_json, args.corrections,
+                              FrameCache(args.cache_dir, args.cache_size), stages)
+        master = frames['twitter_archive_master']
+        with stages.stage('write_master', len(master)):
+            export_master(master).to_csv(args.output, index=True)
+        if args.binary:
+            with stages.stage('write_binary', len(master)):
+                written = write_binary(export_master(master), args.output)
+            print('master written to {}'.format(', '.join(written)))
+        write_master_state(args.output, master_state(master))
+        with stages.stage('aggregate_master', len(master)):
+            Aggregates.from_frame(master).save(master_aggregates_path(args.output))
+        print('{} rows written to {}'.format(len(master), args.output))
+        #resident size of the master with and without the schema
+        print(memory_report(plain_dtypes(master), master).loc['total'].to_string())
+    else:
+        retweets = RetweetLinks()
+        written, report = build_master_streaming(args.archive, args.predictions, args.tweet_json,
+                                                 args.corrections, args.output, args.chunksize, stages, retweets)
+        links = retweets.report()
+        print('{} rows written to {}'.format(written, args.output))
+        print('{} of {} corrections matched'.format((report['matched'] > 0).sum(), len(report)))
+        print('{} retweets dropped, {} of them retweet a tweet of the archive'.format(
+            len(links), links['original_in_archive'].sum()))
+    if args.report:
+        stages.write_json(args.report)
+
+
+if __name__ == '__main__':
+    main()
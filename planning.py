@@ -0,0 +1,312 @@
+# coding: utf-8
+
+# Cleaning plans: the steps of a cleaning function recorded as data, reordered before they run and executed
+# over the columns of the frame instead of reassigning the whole frame at every step.
+#
+#   plan = (Plan('clean_archive')
+#           .filter('drop_retweets', lambda df: df['retweeted_status_user_id'].isnull(), ['retweeted_status_user_id'])
+#           .cast('tweet_id', np.int64)
+#           .derive('dog_stage', dog_stage, STAGES)
+#           .drop(STAGES))
+#   plan = plan.optimize(pd.read_csv(path, nrows=0).columns)
+#   df, results = plan.execute(pd.read_csv(path, usecols=plan.read_columns))
+#   print(plan.explain())
+#
+# Every step declares the columns it uses and the columns it makes, which makes the plan a DAG: a step
+# depends on the steps that made the columns it uses. The kinds of steps are
+#   filter     keeps the rows where func(frame) is True,
+#   cast       replaces a column by func(column), or by column.astype(dtype),
+#   derive     sets the `makes` columns to func(frame) (one column, or a frame holding them),
+#   transform  func(frame) returns the rows it keeps (by index label) with new values of the `makes` columns,
+#              or (frame, result); the results are returned by execute() under the name of the step,
+#   drop, rename and select.
+# func always gets a frame of the `uses` columns only, indexed by row position.
+#
+# optimize() rewrites the plan without changing its result:
+#   - every filter is moved before the casts, derives and transforms it does not depend on, so they run on
+#     fewer rows. Steps that look at other rows than their own (rowwise=False, e.g. the first jpg_url or a
+#     transform whose result counts rows) are never crossed, and such a filter never crosses a step that drops
+#     rows;
+#   - with the columns of the input, columns never used and not in the result are pruned: they are left out
+#     of read_columns (the usecols of pd.read_csv) and of the drops, and casts or derives whose columns are
+#     never used are removed;
+#   - consecutive drops are merged into one.
+# execute() keeps the columns in a dict, each with the row positions it holds. A filter or transform only
+# narrows the current positions; a column is gathered to them when a step uses it or when the result frame
+# is built, so no step copies the columns it does not touch.
+
+import time
+
+import numpy as np
+import pandas as pd
+
+ROW_STEPS = ['filter', 'transform']
+COLUMN_STEPS = ['cast', 'derive']
+
+
+class Step:
+    def __init__(self, kind, name, func=None, uses=(), makes=(), rowwise=True, columns=None):
+        self.kind = kind
+        self.name = name
+        self.func = func
+        self.uses = list(uses)
+        self.makes = list(makes)
+        self.rowwise = rowwise
+        #the columns of drop and select, the mapping of rename
+        self.columns = columns
+
+    def copy(self, **changes):
+        step = Step(self.kind, self.name, self.func, self.uses, self.makes, self.rowwise, self.columns)
+        for key, value in changes.items():
+            setattr(step, key, value)
+        return step
+
+    def describe(self):
+        if self.kind in ('drop', 'select'):
+            return '{} {}'.format(self.kind, ', '.join(self.columns))
+        if self.kind == 'rename':
+            return 'rename {}'.format(', '.join('{} -> {}'.format(*item) for item in self.columns.items()))
+        text = '{} {}: {}'.format(self.kind, self.name, ', '.join(self.uses))
+        if self.makes and self.kind != 'cast':
+            text += ' -> ' + ', '.join(self.makes)
+        return text
+
+
+def can_precede(step, filter_step):
+    #True when filter_step gives the same result when it runs right before `step`
+    if step.kind == 'filter':
+        #filters keep their order
+        return False
+    if step.kind == 'rename':
+        return not set(step.columns.values()) & set(filter_step.uses)
+    if step.kind in ('drop', 'select'):
+        return True
+    if set(step.makes) & set(filter_step.uses) or not step.rowwise:
+        return False
+    return filter_step.rowwise or step.kind != 'transform'
+
+
+def to_array(values):
+    #the values of a column as an array that can be taken from and that pd.DataFrame accepts as it is
+    values = values.array if isinstance(values, (pd.Series, pd.Index)) else values
+    return values.to_numpy() if isinstance(values, pd.arrays.NumpyExtensionArray) else values
+
+
+class Plan:
+    def __init__(self, name='plan', steps=None):
+        self.name = name
+        self.steps = list(steps or [])
+        #set by optimize(): the input columns to read (None reads them all) and what the optimizer changed
+        self.read_columns = None
+        self.notes = []
+        #set by execute(): (rows in, rows out, seconds) of every step of the last run
+        self.runs = None
+
+    def _add(self, step):
+        self.steps.append(step)
+        return self
+
+    # ## Steps
+
+    def filter(self, name, func, uses, rowwise=True):
+        return self._add(Step('filter', name, func, uses, rowwise=rowwise))
+
+    def cast(self, column, func):
+        #func is a dtype or a function of the column
+        convert = func if callable(func) and not isinstance(func, type) else (lambda values: values.astype(func))
+        return self._add(Step('cast', column, lambda df: convert(df[column]), [column], [column]))
+
+    def derive(self, makes, func, uses, name=None, rowwise=True):
+        makes = [makes] if isinstance(makes, str) else list(makes)
+        return self._add(Step('derive', name or '_'.join(makes), func, uses, makes, rowwise))
+
+    def transform(self, name, func, uses, makes, rowwise=False):
+        return self._add(Step('transform', name, func, uses, makes, rowwise))
+
+    def drop(self, columns):
+        return self._add(Step('drop', 'drop', columns=list(columns)))
+
+    def rename(self, mapping):
+        return self._add(Step('rename', 'rename', columns=dict(mapping)))
+
+    def select(self, columns):
+        return self._add(Step('select', 'select', columns=list(columns)))
+
+    # ## Optimizer
+
+    def dependencies(self):
+        #for every step, the earlier steps that made the columns it uses (the edges of the DAG)
+        made = {}
+        edges = []
+        for i, step in enumerate(self.steps):
+            if step.kind == 'rename':
+                edges.append(sorted({made[old] for old in step.columns if old in made}))
+                for old, new in step.columns.items():
+                    if old in made:
+                        made[new] = made.pop(old)
+                continue
+            edges.append(sorted({made[column] for column in step.uses if column in made}))
+            for column in step.makes:
+                made[column] = i
+        return edges
+
+    def _push_filters(self, steps, notes):
+        for i in range(len(steps)):
+            if steps[i].kind != 'filter':
+                continue
+            target = i
+            while target > 0 and can_precede(steps[target - 1], steps[i]):
+                target -= 1
+            if target < i:
+                crossed = [step.name for step in steps[target:i] if step.kind in COLUMN_STEPS + ROW_STEPS]
+                if crossed:
+                    notes.append('filter {} moved before {}'.format(steps[i].name, ', '.join(crossed)))
+                steps.insert(target, steps.pop(i))
+        return steps
+
+    def _prune(self, steps, columns, notes):
+        #columns present after every step, forward
+        schema = list(columns)
+        for step in steps:
+            if step.kind in ('drop', 'select'):
+                schema = [column for column in schema if (column not in step.columns) == (step.kind == 'drop')]
+            elif step.kind == 'rename':
+                schema = [step.columns.get(column, column) for column in schema]
+            else:
+                schema += [column for column in step.makes if column not in schema]
+        #columns needed after every step, backward, leaving out casts and derives nothing needs
+        live = set(schema)
+        kept = []
+        for step in reversed(steps):
+            if step.kind in COLUMN_STEPS and not set(step.makes) & live:
+                notes.append('{} {} removed, {} never used'.format(step.kind, step.name, ', '.join(step.makes)))
+                continue
+            if step.kind == 'rename':
+                renamed = {new: old for old, new in step.columns.items()}
+                live = {renamed.get(column, column) for column in live}
+            elif step.kind not in ('drop', 'select'):
+                live = (live - set(step.makes)) | set(step.uses)
+            kept.append(step)
+        steps = kept[::-1]
+        read = [column for column in columns if column in live]
+        pruned = [column for column in columns if column not in live]
+        if pruned:
+            notes.append('not read: {}'.format(', '.join(pruned)))
+        #forward again with the columns that are read, drops and renames of the pruned columns are left out
+        schema = set(read)
+        rewritten = []
+        for step in steps:
+            if step.kind == 'drop':
+                step = step.copy(columns=[column for column in step.columns if column in schema])
+                schema -= set(step.columns)
+                if not step.columns:
+                    continue
+            elif step.kind == 'rename':
+                step = step.copy(columns={old: new for old, new in step.columns.items() if old in schema})
+                schema = {step.columns.get(column, column) for column in schema}
+                if not step.columns:
+                    continue
+            elif step.kind == 'select':
+                schema &= set(step.columns)
+                step = step.copy(columns=[column for column in step.columns if column in schema])
+            else:
+                schema |= set(step.makes)
+            rewritten.append(step)
+        return rewritten, read
+
+    def _merge_drops(self, steps, notes):
+        merged = []
+        for step in steps:
+            if step.kind == 'drop' and merged and merged[-1].kind == 'drop':
+                notes.append('merged drop {} into the drop before'.format(', '.join(step.columns)))
+                merged[-1] = merged[-1].copy(columns=merged[-1].columns + step.columns)
+            else:
+                merged.append(step)
+        return merged
+
+    def optimize(self, columns=None):
+        #the optimized plan; with the input columns, also the columns to read (read_columns)
+        notes = []
+        steps = self._push_filters(list(self.steps), notes)
+        read = None
+        if columns is not None:
+            steps, read = self._prune(steps, list(columns), notes)
+        plan = Plan(self.name, self._merge_drops(steps, notes))
+        plan.read_columns = read
+        plan.notes = notes
+        return plan
+
+    # ## Execution
+
+    def execute(self, df):
+        #run the plan on df, returns the result frame and the results of the transforms by step name
+        rows = np.arange(len(df))
+        names = df.columns if self.read_columns is None else [c for c in df.columns if c in self.read_columns]
+        #name -> (values, the row positions of df they hold)
+        columns = {name: (to_array(df[name]), rows) for name in names}
+        results = {}
+        runs = []
+
+        def gather(name):
+            values, held = columns[name]
+            if held is not rows:
+                #rows only ever narrow and stay in order: as many rows are the same rows, fewer are found in
+                #held by binary search
+                if len(held) != len(rows):
+                    #ExtensionArray.take, not pd.api.extensions.take: arrow backed arrays take no axis
+                    positions = np.searchsorted(held, rows)
+                    values = values.take(positions) if isinstance(values, pd.api.extensions.ExtensionArray) \
+                        else np.take(values, positions, axis=0)
+                columns[name] = (values, rows)
+            return values
+
+        def view(uses):
+            return pd.DataFrame({name: gather(name) for name in uses}, index=rows)
+
+        for step in self.steps:
+            start = time.perf_counter()
+            rows_in = len(rows)
+            if step.kind == 'filter':
+                rows = rows[np.asarray(step.func(view(step.uses)), dtype=bool)]
+            elif step.kind in COLUMN_STEPS:
+                values = step.func(view(step.uses))
+                for name in step.makes:
+                    column = values[name] if isinstance(values, pd.DataFrame) else values
+                    columns[name] = (to_array(column), rows)
+            elif step.kind == 'transform':
+                values = step.func(view(step.uses))
+                if isinstance(values, tuple):
+                    values, results[step.name] = values
+                rows = values.index.to_numpy(dtype=np.int64)
+                for name in step.makes:
+                    columns[name] = (to_array(values[name]), rows)
+            elif step.kind == 'drop':
+                for name in step.columns:
+                    del columns[name]
+            elif step.kind == 'rename':
+                columns = {step.columns.get(name, name): value for name, value in columns.items()}
+            elif step.kind == 'select':
+                columns = {name: columns[name] for name in step.columns}
+            runs.append((rows_in, len(rows), time.perf_counter() - start))
+        frame = pd.DataFrame({name: gather(name) for name in columns}, index=df.index[rows])
+        self.runs = runs
+        return frame, results
+
+    def explain(self):
+        #the steps in the order they run, with their DAG edges, what optimize() changed and the rows and
+        #time of every step of the last run
+        lines = ['plan {}'.format(self.name)]
+        if self.read_columns is not None:
+            lines.append('read: {}'.format(', '.join(self.read_columns)))
+        for i, (step, edges) in enumerate(zip(self.steps, self.dependencies())):
+            line = '{:>3}  {}'.format(i, step.describe())
+            if edges:
+                line += '  (after {})'.format(', '.join(str(edge) for edge in edges))
+            if not step.rowwise:
+                line += '  [not row-wise]'
+            if self.runs is not None:
+                rows_in, rows_out, seconds = self.runs[i]
+                line += '  rows {} -> {}, {:.1f}ms'.format(rows_in, rows_out, seconds * 1000)
+            lines.append(line)
+        lines += ['  - ' + note for note in self.notes]
+        return '\n'.join(lines)
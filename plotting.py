@@ -0,0 +1,231 @@
+# coding: utf-8
+
+# Headless rendering of the insight plots of wrangle_act.py, for archives too large to plot point by point.
+#
+# Every plot is drawn from a summary whose size does not depend on the number of tweets, so the render time
+# stays the same for 2k or 10M tweets:
+#   - retweet_count vs favorite_count (the regplot of Insight 2): a fixed grid of log10(1 + count) bins drawn
+#     as a density image, a reservoir sample of the points and the least-squares line of analysis.Correlation,
+#   - the source and dog_stage pies (Insights 3 and 4): the k largest groups of analysis.Aggregates, the others
+#     in one 'other' slice,
+#   - the breed bars (Visualization): the mean rating of the k breeds with most tweets, the others pooled.
+# The summaries are updated chunk by chunk and the figures are written straight to files by the Agg canvas,
+# without pyplot, so rendering does not switch the backend of a running notebook.
+#
+# Run with:  python plotting.py [--master twitter_archive_master.csv] [--output-dir plots] [--top 12]
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from analysis import AGGREGATE_KEYS, AGGREGATE_VALUES, Aggregates, Correlation
+
+MASTER_PATH = 'twitter_archive_master.csv'
+#the density grid covers log10(1 + count) from 0 to 9, up to a billion retweets or favorites
+DENSITY_DECADES = 9
+
+
+# ## Summaries
+
+def float_column(values):
+    return pd.Series(values).to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+class Reservoir:
+    #uniform sample of at most `size` rows of columns added chunk by chunk (reservoir sampling, algorithm R
+    #with the draws of a whole chunk made at once). Rows with a missing value are skipped.
+    def __init__(self, size=5000, seed=None):
+        self.size = size
+        self.rng = np.random.default_rng(seed)
+        self.seen = 0
+        self.sample = None
+
+    def add(self, *columns):
+        rows = np.column_stack([float_column(column) for column in columns])
+        rows = rows[~np.isnan(rows).any(axis=1)]
+        if self.sample is None:
+            self.sample = np.empty((0, rows.shape[1]))
+        fill = min(self.size - len(self.sample), len(rows))
+        self.sample = np.concatenate([self.sample, rows[:fill]])
+        self.seen += fill
+        rows = rows[fill:]
+        if len(rows):
+            #the t-th row seen replaces slot j, drawn uniformly in [0, t), when j < size
+            slots = self.rng.integers(0, self.seen + np.arange(1, len(rows) + 1))
+            taken = slots < self.size
+            slots, rows = slots[taken], rows[taken]
+            #a slot drawn twice in the chunk keeps the later row, as in the row by row algorithm
+            last = ~pd.Index(slots).duplicated(keep='last')
+            self.sample[slots[last]] = rows[last]
+            self.seen += len(taken)
+        return self
+
+
+class DensityGrid:
+    #2d histogram of log10(1 + x) and log10(1 + y) on a fixed bins x bins grid, so grids of chunks or
+    #partitions add up. Pairs with a missing value are skipped.
+    def __init__(self, bins=200, decades=DENSITY_DECADES):
+        self.edges = np.linspace(0, decades, bins + 1)
+        self.counts = np.zeros((bins, bins), dtype=np.int64)
+
+    def add(self, x, y):
+        x, y = float_column(x), float_column(y)
+        valid = ~(np.isnan(x) | np.isnan(y))
+        counts, _, _ = np.histogram2d(np.log10(1 + np.maximum(x[valid], 0)),
+                                      np.log10(1 + np.maximum(y[valid], 0)), bins=[self.edges, self.edges])
+        self.counts += counts.astype(np.int64)
+        return self
+
+    def merge(self, other):
+        self.counts += other.counts
+        return self
+
+
+class Engagement:
+    #the summaries of the retweet_count vs favorite_count plot
+    def __init__(self, bins=200, sample=2000, seed=None):
+        self.grid = DensityGrid(bins)
+        self.reservoir = Reservoir(sample, seed)
+        self.correlation = Correlation()
+
+    def add(self, x, y):
+        self.grid.add(x, y)
+        self.reservoir.add(x, y)
+        self.correlation.add(x, y)
+        return self
+
+
+def top_k(counts, k, other='other'):
+    #the k largest counts, the others summed into one `other` bucket
+    counts = counts.sort_values(ascending=False, kind='stable')
+    if len(counts) <= k:
+        return counts
+    return pd.concat([counts.iloc[:k], pd.Series({other: counts.iloc[k:].sum()})])
+
+
+def top_k_means(table, value, k, other='other'):
+    #mean of `value` for the k groups of an Aggregates table with the most rows, the others pooled into `other`
+    order = table['rows']['count'].sort_values(ascending=False, kind='stable').index
+    stats = table[value].loc[order]
+    means = stats['mean'].iloc[:k]
+    if len(stats) <= k:
+        return means
+    rest = stats.iloc[k:]
+    return pd.concat([means, pd.Series({other: rest['sum'].sum() / rest['count'].sum()})])
+
+
+# ## Rendering
+
+def new_figure(figsize):
+    #a figure with its own Agg canvas, matplotlib is imported on first use
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    figure = Figure(figsize=figsize)
+    FigureCanvasAgg(figure)
+    return figure
+
+
+def plot_engagement(path, engagement, title='retweet_count vs favorite_count', dpi=100):
+    from matplotlib.colors import LogNorm
+    figure = new_figure((8, 6))
+    ax = figure.add_subplot()
+    counts, edges = engagement.grid.counts, engagement.grid.edges
+    if counts.any():
+        mesh = ax.pcolormesh(edges, edges, np.ma.masked_equal(counts.T, 0), norm=LogNorm(), cmap='viridis')
+        figure.colorbar(mesh, ax=ax, label='tweets')
+        #zoom on the bins that hold tweets
+        used_x = np.flatnonzero(counts.any(axis=1))
+        used_y = np.flatnonzero(counts.any(axis=0))
+        ax.set_xlim(edges[used_x[0]], edges[used_x[-1] + 1])
+        ax.set_ylim(edges[used_y[0]], edges[used_y[-1] + 1])
+        sample = engagement.reservoir.sample
+        if sample is not None and len(sample):
+            ax.scatter(np.log10(1 + np.maximum(sample[:, 0], 0)), np.log10(1 + np.maximum(sample[:, 1], 0)),
+                       s=2, color='black', alpha=0.3, label='sample of {} tweets'.format(len(sample)))
+        statistics = engagement.correlation.statistics().iloc[0]
+        if np.isfinite(statistics['slope']):
+            #the least-squares line fitted on the counts, drawn on the log axes
+            x = 10 ** np.linspace(edges[used_x[0]], edges[used_x[-1] + 1], 200) - 1
+            y = statistics['slope'] * x + statistics['intercept']
+            drawn = y > -1
+            ax.plot(np.log10(1 + x[drawn]), np.log10(1 + y[drawn]), color='red',
+                    label='least squares, r = {:.2f}'.format(statistics['corr']))
+        ax.legend(loc='best')
+    ax.set_xlabel('log10(1 + retweet_count)')
+    ax.set_ylabel('log10(1 + favorite_count)')
+    ax.set_title(title)
+    figure.savefig(path, dpi=dpi)
+    return path
+
+
+def plot_pie(path, counts, title, dpi=100):
+    figure = new_figure((7, 7))
+    ax = figure.add_subplot()
+    ax.pie(counts.to_numpy(), labels=counts.index, autopct='%.f%%', shadow=True)
+    ax.set_title(title)
+    figure.savefig(path, dpi=dpi)
+    return path
+
+
+def plot_bars(path, values, title, ylabel, line=None, dpi=100):
+    #one bar per value, with a red horizontal line at `line` when given
+    figure = new_figure((max(6, 0.4 * len(values)), 5))
+    ax = figure.add_subplot()
+    ax.bar(np.arange(len(values)), values.to_numpy(), color='indigo')
+    ax.set_xticks(np.arange(len(values)))
+    ax.set_xticklabels(values.index, rotation=90, fontsize=8)
+    if line is not None:
+        ax.axhline(line, color='r')
+    ax.set_title(title)
+    ax.set_ylabel(ylabel)
+    figure.tight_layout()
+    figure.savefig(path, dpi=dpi)
+    return path
+
+
+def render_insights(directory, aggregates, engagement, k=12, min_rows=16):
+    #write the insight plots as png files to directory, returns their paths
+    os.makedirs(directory, exist_ok=True)
+    breeds = aggregates.table('breed_of_dog', min_rows=min_rows)
+    ratings = breeds['rating_numerator']
+    return [
+        plot_engagement(os.path.join(directory, 'engagement.png'), engagement),
+        plot_pie(os.path.join(directory, 'source.png'),
+                 top_k(aggregates.table('source')['rows']['count'], k), 'ditribution of source'),
+        plot_pie(os.path.join(directory, 'dog_stage.png'),
+                 top_k(aggregates.table('dog_stage')['rows']['count'], k), 'ditribution of the dog stage'),
+        plot_bars(os.path.join(directory, 'breed_rating.png'), top_k_means(breeds, 'rating_numerator', k),
+                  'Average rating numerator of the breeds with {}+ tweets'.format(min_rows),
+                  'Average rating numerator', line=ratings['sum'].sum() / ratings['count'].sum()),
+    ]
+
+
+def summarize_master(path=MASTER_PATH, chunksize=100000, bins=200, sample=2000, seed=0):
+    #Aggregates and Engagement of a stored master, read chunk by chunk
+    aggregates = Aggregates()
+    engagement = Engagement(bins, sample, seed)
+    for chunk in pd.read_csv(path, usecols=AGGREGATE_KEYS + AGGREGATE_VALUES, chunksize=chunksize):
+        aggregates.add(chunk)
+        engagement.add(chunk['retweet_count'], chunk['favorite_count'])
+    return aggregates, engagement
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='render the insight plots of twitter_archive_master.csv to files')
+    parser.add_argument('--master', default=MASTER_PATH)
+    parser.add_argument('--output-dir', default='plots')
+    parser.add_argument('--chunksize', type=int, default=100000)
+    parser.add_argument('--top', type=int, default=12, help='groups shown in the pies and bars')
+    parser.add_argument('--bins', type=int, default=200, help='bins per axis of the density grid')
+    parser.add_argument('--sample', type=int, default=2000, help='points drawn over the density grid')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    aggregates, engagement = summarize_master(args.master, args.chunksize, args.bins, args.sample, args.seed)
+    for path in render_insights(args.output_dir, aggregates, engagement, args.top):
+        print(path)
+
+
+if __name__ == '__main__':
+    main()
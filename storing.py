@@ -0,0 +1,517 @@
+# coding: utf-8
+
+# On-disk storage of the clean frames.
+
+import hashlib
+import importlib.util
+import json
+import operator
+import os
+import shutil
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+from cleaning import PREDICTION_COLUMNS
+
+#pyarrow is only looked up here, pandas imports it when a parquet file is read or written
+HAS_ARROW = importlib.util.find_spec('pyarrow') is not None
+
+
+# ## Cache of clean frames
+#
+# Each entry is a directory <name>-<key> holding one frame, as Parquet when pyarrow is installed,
+# otherwise as one .npy file per column that is memory-mapped back on read.
+# The key is a hash of the input files and of the code that cleaned them, so any change to either
+# misses the cache. Entries are evicted least recently used first once the cache is over max_bytes.
+
+def file_digest(path, block=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for data in iter(lambda: file.read(block), b''):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def cache_key(*paths):
+    #hash of the content of every file in paths (inputs and code), in order
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(os.path.basename(path).encode())
+        digest.update(file_digest(path).encode())
+    return digest.hexdigest()[:32]
+
+
+def save_strings(directory, name, values):
+    #unique strings as one utf-8 buffer v<name>.npy with the offsets of every string in o<name>.npy
+    data = [value.encode('utf-8') for value in values]
+    offsets = np.zeros(len(data) + 1, dtype=np.int64)
+    np.cumsum([len(item) for item in data], out=offsets[1:])
+    np.save(os.path.join(directory, 'o{}.npy'.format(name)), offsets)
+    np.save(os.path.join(directory, 'v{}.npy'.format(name)), np.frombuffer(b''.join(data), dtype=np.uint8))
+
+
+def load_strings(directory, name):
+    offsets = np.load(os.path.join(directory, 'o{}.npy'.format(name)))
+    buffer = np.load(os.path.join(directory, 'v{}.npy'.format(name)), mmap_mode='r')
+    text = buffer.tobytes()
+    values = np.empty(len(offsets) - 1, dtype=object)
+    values[:] = [text[start:end].decode('utf-8') for start, end in zip(offsets[:-1], offsets[1:])]
+    return values
+
+
+def is_strings(values):
+    return pd.api.types.infer_dtype(values, skipna=True) in ('string', 'empty')
+
+
+def save_frame(df, directory):
+    #numpy fallback: numeric columns are saved as plain arrays,
+    #datetimes as int64 (UTC) in their own unit, nullable numbers as values + mask, categoricals as codes +
+    #categories and strings as codes + the utf-8 buffer of the unique strings, all memory-mapped on read; only
+    #columns of other python objects are pickled
+    os.makedirs(directory, exist_ok=True)
+    columns = []
+    for i, (name, column) in enumerate(df.items()):
+        meta = {'name': name, 'file': 'c{}.npy'.format(i), 'dtype': str(column.dtype)}
+        if isinstance(column.dtype, pd.CategoricalDtype) and is_strings(column.cat.categories):
+            meta['kind'] = 'category'
+            np.save(os.path.join(directory, meta['file']), column.cat.codes.to_numpy())
+            save_strings(directory, 'k{}'.format(i), column.cat.categories)
+        elif isinstance(column.dtype, pd.DatetimeTZDtype) or column.dtype.kind == 'M':
+            meta['kind'] = 'datetime'
+            meta['tz'] = str(column.dt.tz) if column.dt.tz is not None else None
+            if meta['tz']:
+                column = column.dt.tz_convert('UTC').dt.tz_localize(None)
+            values = column.to_numpy()
+            meta['unit'] = np.datetime_data(values.dtype)[0]
+            np.save(os.path.join(directory, meta['file']), values.view(np.int64))
+        elif isinstance(column.dtype, np.dtype) and column.dtype.kind in 'biuf':
+            meta['kind'] = 'numeric'
+            np.save(os.path.join(directory, meta['file']), column.to_numpy())
+        elif isinstance(column.dtype, pd.api.extensions.ExtensionDtype) and column.dtype.kind in 'biuf':
+            #nullable integers, floats and booleans as their values (0 where missing) and the mask m<i>.npy
+            meta['kind'] = 'masked'
+            np.save(os.path.join(directory, meta['file']), column.to_numpy(column.dtype.numpy_dtype, na_value=0))
+            np.save(os.path.join(directory, 'm{}.npy'.format(i)), column.isna().to_numpy())
+        elif is_strings(column):
+            #missing values get the code -1
+            meta['kind'] = 'strings'
+            codes, uniques = pd.factorize(column.to_numpy(dtype=object))
+            np.save(os.path.join(directory, meta['file']), codes.astype(np.int32))
+            save_strings(directory, str(i), uniques)
+        else:
+            meta['kind'] = 'object'
+            np.save(os.path.join(directory, meta['file']), column.to_numpy(dtype=object), allow_pickle=True)
+        columns.append(meta)
+    index = df.index.to_numpy()
+    np.save(os.path.join(directory, 'index.npy'), index, allow_pickle=index.dtype == object)
+    with open(os.path.join(directory, 'columns.json'), 'w') as file:
+        json.dump(columns, file)
+
+
+def load_frame(directory, columns=None, rows=None):
+    #only `columns` when given, and only the row positions `rows` (an array) when given, gathered from the
+    #memory maps so the other rows are not read
+    with open(os.path.join(directory, 'columns.json')) as file:
+        metas = json.load(file)
+    data = {}
+    for i, meta in enumerate(metas):
+        if columns is not None and meta['name'] not in columns:
+            continue
+        path = os.path.join(directory, meta['file'])
+        if meta['kind'] == 'numeric':
+            values = np.load(path, mmap_mode='r')
+            data[meta['name']] = values if rows is None else values[rows]
+        elif meta['kind'] == 'category':
+            codes = np.load(path, mmap_mode='r')
+            data[meta['name']] = pd.Categorical.from_codes(codes if rows is None else codes[rows],
+                                                           categories=load_strings(directory, 'k{}'.format(i)))
+        elif meta['kind'] == 'datetime':
+            values = np.load(path, mmap_mode='r')
+            values = pd.to_datetime((values if rows is None else values[rows]).view(
+                'datetime64[{}]'.format(meta['unit'])))
+            data[meta['name']] = values.tz_localize('UTC').tz_convert(meta['tz']) if meta['tz'] else values
+        elif meta['kind'] == 'masked':
+            values = np.load(path, mmap_mode='r')
+            mask = np.load(os.path.join(directory, 'm{}.npy'.format(i)), mmap_mode='r')
+            values = pd.array(np.asarray(values if rows is None else values[rows]), dtype=meta['dtype'])
+            values[np.asarray(mask if rows is None else mask[rows])] = pd.NA
+            data[meta['name']] = values
+        elif meta['kind'] == 'strings':
+            codes = np.load(path, mmap_mode='r')
+            codes = np.asarray(codes if rows is None else codes[rows])
+            uniques = np.append(load_strings(directory, str(i)), np.nan)
+            #code -1 takes the nan appended last
+            data[meta['name']] = pd.array(uniques[codes], dtype=meta['dtype'])
+        else:
+            values = np.load(path, allow_pickle=True)
+            values = values if rows is None else values[rows]
+            data[meta['name']] = pd.array(values, dtype=meta['dtype']) if meta['dtype'] != 'object' else values
+    index = np.load(os.path.join(directory, 'index.npy'), allow_pickle=True)
+    frame = pd.DataFrame(data, index=index if rows is None else index[rows])
+    #pandas infers str for object columns of strings, they are made object again
+    objects = [meta['name'] for meta in metas if meta['dtype'] == 'object' and meta['name'] in data]
+    frame = frame.astype(dict.fromkeys(objects, object)) if objects else frame
+    return frame if columns is None else frame[[column for column in columns if column in frame]]
+
+
+class FrameCache:
+    def __init__(self, directory='.wrangle_cache', max_bytes=1 << 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _entry(self, name, key):
+        return os.path.join(self.directory, '{}-{}'.format(name, key))
+
+    def get(self, name, key):
+        #the cached frame, or None on a miss
+        entry = self._entry(name, key)
+        if not os.path.isdir(entry):
+            return None
+        #mark the entry as recently used for the LRU eviction
+        os.utime(entry)
+        if os.path.exists(os.path.join(entry, 'frame.parquet')):
+            return pd.read_parquet(os.path.join(entry, 'frame.parquet'))
+        return load_frame(entry)
+
+    def put(self, name, key, df):
+        entry = self._entry(name, key)
+        #write to a temporary directory first so a crash never leaves half an entry behind
+        partial = entry + '.partial'
+        shutil.rmtree(partial, ignore_errors=True)
+        os.makedirs(partial)
+        if HAS_ARROW:
+            df.to_parquet(os.path.join(partial, 'frame.parquet'))
+        else:
+            save_frame(df, partial)
+        shutil.rmtree(entry, ignore_errors=True)
+        os.rename(partial, entry)
+        self.evict()
+
+    def entries(self):
+        #(last used, size in bytes, path) of every entry, least recently used first
+        entries = []
+        for entry in os.listdir(self.directory):
+            path = os.path.join(self.directory, entry)
+            if not os.path.isdir(path) or entry.endswith('.partial'):
+                continue
+            size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+            entries.append((os.stat(path).st_mtime, size, path))
+        return sorted(entries)
+
+    def evict(self):
+        #drop least recently used entries until the cache fits in max_bytes
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+    def cached(self, name, key, build):
+        #return the cached frame for (name, key), calling build() and storing its result on a miss
+        df = self.get(name, key)
+        if df is None:
+            df = build()
+            self.put(name, key, df)
+        return df
+
+
+# ## Cache of image predictions
+#
+# The predictions of an image (the p1-p3 labels, confidences and dog flags) only depend on the image, so they
+# are kept in a SQLite table keyed by the 64-bit digest of its jpg_url (cleaning.url_digests), one row per
+# image however many tweets share it. The labels are stored as codes of a labels table, every other column
+# is a number. A lookup inserts the wanted digests into a temporary table and joins it with the predictions,
+# so a frame of urls costs one query. Once there are more than max_entries images, the ones not looked up
+# for the longest time are evicted; the last use is only rewritten when it is older than touch_seconds, so
+# lookups repeated within that time do not write.
+
+PREDICTION_LABELS = ['p1', 'p2', 'p3']
+PREDICTION_FLAGS = ['p1_dog', 'p2_dog', 'p3_dog']
+
+
+def _sql_keys(digests):
+    #uint64 digests as the signed integers SQLite stores
+    return np.asarray(digests, dtype=np.uint64).view(np.int64).tolist()
+
+
+def prediction_types(df):
+    #labels as objects, confidences as float64 and dog flags as bool, like pd.read_csv of image_predictions.tsv
+    df = df.copy()
+    for column in PREDICTION_COLUMNS:
+        df[column] = (df[column].astype(object) if column in PREDICTION_LABELS else
+                      df[column].astype(bool) if column in PREDICTION_FLAGS else df[column].astype(np.float64))
+    return df
+
+
+class PredictionCache:
+    def __init__(self, path=os.path.join('.wrangle_cache', 'predictions.sqlite'), max_entries=1000000,
+                 touch_seconds=3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.touch_seconds = touch_seconds
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        columns = ', '.join('{} {}'.format(column, 'REAL' if column.endswith('_conf') else 'INTEGER')
+                            for column in PREDICTION_COLUMNS)
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS labels (code INTEGER PRIMARY KEY, label TEXT UNIQUE)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS predictions '
+                                    '(digest INTEGER PRIMARY KEY, used REAL NOT NULL, {})'.format(columns))
+            self.connection.execute('CREATE INDEX IF NOT EXISTS predictions_used ON predictions (used)')
+            self.connection.execute('CREATE TEMP TABLE wanted (digest INTEGER PRIMARY KEY)')
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM predictions').fetchone()[0]
+
+    def labels(self):
+        #label of every code, as an object array indexed by code
+        rows = self.connection.execute('SELECT code, label FROM labels').fetchall()
+        labels = np.empty(max((code for code, _ in rows), default=-1) + 1, dtype=object)
+        for code, label in rows:
+            labels[code] = label
+        return labels
+
+    def get(self, digests):
+        #the cached predictions of digests, as a frame indexed by digest (uint64) with one row per digest found
+        now = time.time()
+        with self.connection:
+            self.connection.execute('DELETE FROM wanted')
+            self.connection.executemany('INSERT OR IGNORE INTO wanted VALUES (?)',
+                                        ((key,) for key in _sql_keys(digests)))
+            rows = self.connection.execute('SELECT digest, {} FROM wanted JOIN predictions USING (digest)'
+                                           .format(', '.join(PREDICTION_COLUMNS))).fetchall()
+            #mark the entries found as recently used for the LRU eviction
+            self.connection.execute('UPDATE predictions SET used = ? WHERE used < ? AND digest IN '
+                                    '(SELECT digest FROM wanted)', (now, now - self.touch_seconds))
+        #every column is a number, the labels are mapped from their codes column by column
+        values = np.array(rows, dtype=np.float64).reshape(len(rows), len(PREDICTION_COLUMNS) + 1)
+        digests = np.array([row[0] for row in rows], dtype=np.int64).view(np.uint64)
+        labels = self.labels()
+        found = pd.DataFrame({column: labels[values[:, i + 1].astype(np.int64)] if column in PREDICTION_LABELS
+                              else values[:, i + 1] for i, column in enumerate(PREDICTION_COLUMNS)},
+                             index=pd.Index(digests, name='digest'))
+        return prediction_types(found)
+
+    def put(self, digests, predictions):
+        #store the PREDICTION_COLUMNS of predictions, row i being the image of digests[i]
+        labels = pd.unique(predictions[PREDICTION_LABELS].to_numpy(dtype=object).ravel())
+        columns = []
+        with self.connection:
+            self.connection.executemany('INSERT OR IGNORE INTO labels (label) VALUES (?)',
+                                        ((str(label),) for label in labels))
+            codes = dict(self.connection.execute('SELECT label, code FROM labels').fetchall())
+            for column in PREDICTION_COLUMNS:
+                values = predictions[column]
+                if column in PREDICTION_LABELS:
+                    columns.append(values.astype(str).map(codes).tolist())
+                else:
+                    columns.append(values.to_numpy(dtype=np.int64 if column in PREDICTION_FLAGS
+                                                   else np.float64).tolist())
+            used = time.time()
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO predictions VALUES (?, ?, {})'.format(', '.join('?' * len(columns))),
+                ((key, used) + values for key, values in zip(_sql_keys(digests), zip(*columns))))
+        self.evict()
+
+    def evict(self):
+        #drop the least recently used images until at most max_entries are left
+        with self.connection:
+            self.connection.execute('DELETE FROM predictions WHERE digest IN '
+                                    '(SELECT digest FROM predictions ORDER BY used LIMIT max((SELECT COUNT(*) '
+                                    'FROM predictions) - ?, 0))', (self.max_entries,))
+
+    def close(self):
+        self.connection.close()
+
+
+# ## Typed binary export of the master
+#
+# twitter_archive_master.csv loses the dtypes on the way back and is the slowest file to read downstream.
+# write_binary stores the master typed next to the csv:
+#   - with pyarrow, <name>.parquet in row groups of row_group_size rows, with the min/max statistics of every
+#     column, and <name>.feather, an uncompressed Arrow IPC file that readers memory-map without copying;
+#   - without pyarrow, <name>.frame, a save_frame directory (one memory-mapped .npy file per column), with the
+#     same statistics per block of row_group_size rows in row_groups.json.
+# read_binary reads only `columns` and only the rows that pass `filters`: (column, op, value) conditions that
+# must all hold, op being ==, !=, <, <=, >, >=, in or not in, as in pd.read_parquet. Missing values never
+# pass. Row groups whose statistics rule a condition out are not read, so a filter on timestamp (the master
+# is in time order) or on a rare breed_of_dog or dog_stage only reads the matching part of the file.
+#
+#   write_binary(export_master(twitter_archive_master), 'twitter_archive_master.csv')
+#   read_binary('twitter_archive_master.csv', ['tweet_id', 'breed_of_dog'],
+#               [('timestamp', '>=', pd.Timestamp('2017-01-01', tz='UTC')), ('dog_stage', '==', 'pupper')])
+
+ROW_GROUP_SIZE = 1 << 16
+FILTER_OPS = {'==': operator.eq, '!=': operator.ne, '<': operator.lt, '<=': operator.le, '>': operator.gt,
+              '>=': operator.ge}
+
+
+def binary_paths(path):
+    #the parquet, feather and fallback frame paths of a master csv path
+    base = os.path.splitext(path)[0]
+    return {'parquet': base + '.parquet', 'feather': base + '.feather', 'frame': base + '.frame'}
+
+
+def _is_datetime(column):
+    return isinstance(column.dtype, pd.DatetimeTZDtype) or column.dtype.kind == 'M'
+
+
+def _filter_value(column, value):
+    #datetimes are compared in UTC, a naive value is taken as UTC
+    if not _is_datetime(column):
+        return value
+    value = pd.Timestamp(value)
+    return value.tz_localize('UTC') if value.tz is None else value
+
+
+def _utc_nanoseconds(value):
+    value = pd.Timestamp(value)
+    return int((value.tz_localize('UTC') if value.tz is None else value).as_unit('ns').value)
+
+
+def row_group_stats(df, row_group_size=ROW_GROUP_SIZE):
+    #start, stop and per column statistics of every block of row_group_size rows: the categories present for
+    #categorical columns, min and max for numeric and datetime ones (None when all are missing, datetimes as
+    #UTC nanoseconds)
+    groups = []
+    for start in range(0, len(df), row_group_size):
+        part = df.iloc[start:start + row_group_size]
+        stats = {}
+        for name, column in part.items():
+            if isinstance(column.dtype, pd.CategoricalDtype):
+                codes = np.unique(column.cat.codes.to_numpy())
+                stats[name] = {'values': [str(value) for value in column.cat.categories[codes[codes >= 0]]]}
+            elif _is_datetime(column) or pd.api.types.is_numeric_dtype(column.dtype):
+                valid = column.dropna()
+                convert = _utc_nanoseconds if _is_datetime(column) else float
+                stats[name] = {'min': convert(valid.min()) if len(valid) else None,
+                               'max': convert(valid.max()) if len(valid) else None,
+                               'datetime': _is_datetime(column)}
+        groups.append({'start': start, 'stop': start + len(part), 'stats': stats})
+    return groups
+
+
+def may_match(stats, column, op, value):
+    #False when the statistics of a row group show that no row passes (column op value)
+    if column not in stats:
+        return True
+    stat = stats[column]
+    if 'values' in stat:
+        present = set(stat['values'])
+        if op == '==':
+            return str(value) in present
+        if op == 'in':
+            return bool(present & {str(item) for item in value})
+        if op == '!=':
+            return bool(present - {str(value)})
+        if op == 'not in':
+            return bool(present - {str(item) for item in value})
+        return bool(present)
+    low, high = stat['min'], stat['max']
+    if low is None:
+        return False
+    convert = _utc_nanoseconds if stat['datetime'] else float
+    value = [convert(item) for item in value] if op in ('in', 'not in') else convert(value)
+    if op == 'in':
+        return any(low <= item <= high for item in value)
+    if op in ('!=', 'not in'):
+        return True
+    return {'==': low <= value <= high, '<': low < value, '<=': low <= value, '>': high > value,
+            '>=': high >= value}[op]
+
+
+def filter_mask(df, filters):
+    #rows of df that pass every (column, op, value) condition, missing values never pass
+    mask = np.ones(len(df), dtype=bool)
+    for column, op, value in filters:
+        values = df[column]
+        if op in ('in', 'not in'):
+            passed = values.isin([_filter_value(values, item) for item in value])
+            passed = ~passed if op == 'not in' else passed
+        else:
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                values = values.astype(object)
+            passed = FILTER_OPS[op](values, _filter_value(values, value))
+        mask &= (passed & values.notna()).to_numpy(dtype=bool)
+    return mask
+
+
+def write_binary(df, path, row_group_size=ROW_GROUP_SIZE):
+    #write df typed next to the csv `path`, returns the paths written
+    paths = binary_paths(path)
+    df = df.reset_index(drop=True)
+    if HAS_ARROW:
+        df.to_parquet(paths['parquet'], index=False, row_group_size=row_group_size, write_statistics=True)
+        df.to_feather(paths['feather'], compression='uncompressed')
+        return [paths['parquet'], paths['feather']]
+    partial = paths['frame'] + '.partial'
+    shutil.rmtree(partial, ignore_errors=True)
+    save_frame(df, partial)
+    with open(os.path.join(partial, 'row_groups.json'), 'w') as file:
+        json.dump(row_group_stats(df, row_group_size), file)
+    shutil.rmtree(paths['frame'], ignore_errors=True)
+    os.rename(partial, paths['frame'])
+    return [paths['frame']]
+
+
+def arrow_filters(filters, schema):
+    #filters with their values in the type of their column of the arrow schema: datetimes as Timestamps in the
+    #column's time zone (a naive value is taken as UTC), labels of string or dictionary columns as str
+    import pyarrow
+    normalized = []
+    for column, op, value in filters:
+        kind = schema.field(column).type
+        if pyarrow.types.is_dictionary(kind):
+            kind = kind.value_type
+        if pyarrow.types.is_timestamp(kind):
+            def convert(item, tz=kind.tz):
+                item = pd.Timestamp(item)
+                item = item.tz_localize('UTC') if item.tz is None else item
+                return item.tz_convert(tz) if tz else item.tz_convert('UTC').tz_localize(None)
+        elif pyarrow.types.is_string(kind) or pyarrow.types.is_large_string(kind):
+            convert = str
+        else:
+            def convert(item):
+                return item
+        normalized.append((column, op, [convert(item) for item in value] if op in ('in', 'not in')
+                           else convert(value)))
+    return normalized
+
+
+def read_binary(path, columns=None, filters=None, memory_map=False):
+    #the master written by write_binary for the csv `path`. With pyarrow the parquet file is read, or the
+    #feather file memory-mapped when memory_map is set.
+    paths = binary_paths(path)
+    filters = list(filters or [])
+    if HAS_ARROW and os.path.exists(paths['parquet']):
+        import pyarrow.feather
+        import pyarrow.parquet
+        if not memory_map:
+            filters = arrow_filters(filters, pyarrow.parquet.read_schema(paths['parquet']))
+            return pd.read_parquet(paths['parquet'], columns=columns, filters=filters or None)
+        wanted = None if columns is None else list(dict.fromkeys(list(columns) + [f[0] for f in filters]))
+        table = pyarrow.feather.read_table(paths['feather'], columns=wanted, memory_map=True)
+        if filters:
+            table = table.filter(pyarrow.parquet.filters_to_expression(arrow_filters(filters, table.schema)))
+        df = table.to_pandas()
+        return df if columns is None else df[list(columns)]
+    with open(os.path.join(paths['frame'], 'row_groups.json')) as file:
+        groups = json.load(file)
+    rows = None
+    if filters:
+        kept = [group for group in groups
+                if all(may_match(group['stats'], column, op, value) for column, op, value in filters)]
+        rows = (np.concatenate([np.arange(group['start'], group['stop']) for group in kept]) if kept
+                else np.zeros(0, dtype=np.int64))
+    wanted = None if columns is None else list(dict.fromkeys(list(columns) + [f[0] for f in filters]))
+    df = load_frame(paths['frame'], wanted, rows)
+    if filters:
+        df = df[filter_mask(df, filters)]
+    df = df.reset_index(drop=True)
+    return df if columns is None else df[list(columns)]
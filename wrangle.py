@@ -0,0 +1,158 @@
+# coding: utf-8
+
+# Command line entry point for batch runs of the steps of wrangle_act.py:
+#
+#   python wrangle.py gather                   download image_predictions.tsv (only when it changed)
+#   python wrangle.py enrich --url URL         look the archive's tweets up in the API into tweet-json.txt
+#   python wrangle.py clean                    clean the three sources into the frame cache
+#   python wrangle.py merge [pipeline options] build twitter_archive_master.csv, see python pipeline.py --help
+#   python wrangle.py analyze                  print the insights from the master and its aggregates
+#   python wrangle.py plot [plotting options]  render the insight plots, see python plotting.py --help
+#
+# Only the standard library is imported at startup. Every subcommand imports what it needs when it runs, so
+# requests is only loaded by gather and matplotlib only by plot, and a clean or merge job never pays for the
+# HTTP or plotting libraries. benchmark.py --startup measures it with python -X importtime.
+
+import argparse
+import os
+
+ARCHIVE_PATH = 'twitter-archive-enhanced.csv'
+PREDICTIONS_PATH = 'image_predictions.tsv'
+TWEET_JSON_PATH = 'tweet-json.txt'
+CORRECTIONS_PATH = 'rating_corrections.csv'
+MASTER_PATH = 'twitter_archive_master.csv'
+CACHE_DIR = '.wrangle_cache'
+
+
+def gather(args):
+    from gathering import IMAGE_PREDICTIONS_URL, fetch
+    if fetch(args.url or IMAGE_PREDICTIONS_URL, args.predictions):
+        print('{} downloaded'.format(args.predictions))
+    else:
+        print('{} not modified'.format(args.predictions))
+    if args.prediction_cache:
+        import pandas as pd
+
+        from gathering import cache_predictions
+        from storing import PredictionCache
+        cache = cache_predictions(pd.read_csv(args.predictions, sep='\t'), PredictionCache(args.prediction_cache))
+        print('{} images in {}'.format(len(cache), args.prediction_cache))
+
+
+def enrich(args):
+    import pandas as pd
+
+    from enrichment import enrich
+    ids = pd.read_csv(args.archive, usecols=['tweet_id'])['tweet_id']
+    written, missing = enrich(ids, args.url, args.output, batch_size=args.batch_size,
+                              concurrency=args.concurrency, rate=args.rate,
+                              token=os.environ.get('TWITTER_BEARER_TOKEN'))
+    print('{} tweets written to {}, {} not found'.format(written, args.output, missing))
+
+
+def clean(args):
+    from pipeline import build_frames
+    from storing import FrameCache
+    frames = build_frames(args.archive, args.predictions, args.tweet_json, args.corrections,
+                          FrameCache(args.cache_dir, args.cache_size), master=False)
+    for name, df in frames.items():
+        print('{}: {} rows cached in {}'.format(name, len(df), args.cache_dir))
+
+
+def merge(options):
+    import pipeline
+    pipeline.main(options)
+
+
+def analyze(args):
+    import pandas as pd
+
+    from analysis import AGGREGATE_KEYS, AGGREGATE_VALUES, Aggregates, Correlation
+    from pipeline import master_aggregates_path
+    aggregates_path = master_aggregates_path(args.master)
+    #the aggregates written with the master are used unless the master changed after them
+    stored = os.path.exists(aggregates_path) and os.path.getmtime(aggregates_path) >= os.path.getmtime(args.master)
+    aggregates = Aggregates.load(aggregates_path) if stored else Aggregates()
+    correlation = Correlation(args.replicates, args.seed)
+    columns = ['retweet_count', 'favorite_count'] if stored else AGGREGATE_KEYS + AGGREGATE_VALUES
+    for chunk in pd.read_csv(args.master, usecols=columns, chunksize=args.chunksize):
+        if not stored:
+            aggregates.add(chunk)
+        correlation.add(chunk['retweet_count'], chunk['favorite_count'])
+
+    breeds = aggregates.table('breed_of_dog')
+    for value in ['retweet_count', 'favorite_count']:
+        means = breeds[value]['mean'].dropna().sort_values()
+        print('average {} per breed: lowest {} ({:.0f}), highest {} ({:.0f})'.format(
+            value, means.index[0], means.iloc[0], means.index[-1], means.iloc[-1]))
+    print('\nretweet_count vs favorite_count over {} tweets'.format(correlation.n))
+    print(correlation.summary().to_string())
+    for key in ['source', 'dog_stage']:
+        counts = aggregates.table(key)['rows']['count']
+        print('\n% of tweets per {}'.format(key))
+        print((counts / counts.sum() * 100).sort_values(ascending=False).round(1).to_string())
+    ratings = aggregates.table('breed_of_dog', min_rows=args.min_rows)['rating_numerator']
+    print('\naverage rating numerator of the {} breeds with {}+ tweets: {:.2f}'.format(
+        len(ratings), args.min_rows, ratings['sum'].sum() / ratings['count'].sum()))
+
+
+def plot(options):
+    import plotting
+    plotting.main(options)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='wrangle the WeRateDogs archive step by step')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('gather', help='download image_predictions.tsv')
+    command.add_argument('--url', help='default: the Udacity image-predictions.tsv')
+    command.add_argument('--predictions', default=PREDICTIONS_PATH)
+    command.add_argument('--prediction-cache', help='also store the predictions in this SQLite prediction cache, '
+                                                    'e.g. .wrangle_cache/predictions.sqlite')
+
+    command = commands.add_parser('enrich', help='look the tweets of the archive up in a statuses/lookup API',
+                                  description='the ids already in --output are skipped, so a stopped run resumes; '
+                                              'write to a new file to refresh the counts. The bearer token is '
+                                              'read from TWITTER_BEARER_TOKEN.')
+    command.add_argument('--url', required=True, help='e.g. https://api.twitter.com/1.1/statuses/lookup.json')
+    command.add_argument('--archive', default=ARCHIVE_PATH)
+    command.add_argument('--output', default=TWEET_JSON_PATH)
+    command.add_argument('--batch-size', type=int, default=100)
+    command.add_argument('--concurrency', type=int, default=8)
+    command.add_argument('--rate', type=float, default=1.0, help='requests per second')
+
+    command = commands.add_parser('clean', help='clean the sources into the frame cache')
+    command.add_argument('--archive', default=ARCHIVE_PATH)
+    command.add_argument('--predictions', default=PREDICTIONS_PATH)
+    command.add_argument('--tweet-json', default=TWEET_JSON_PATH)
+    command.add_argument('--corrections', default=CORRECTIONS_PATH)
+    command.add_argument('--cache-dir', default=CACHE_DIR)
+    command.add_argument('--cache-size', type=int, default=1 << 30, help='cache size limit in bytes')
+
+    commands.add_parser('merge', help='build twitter_archive_master.csv, takes the options of pipeline.py',
+                        add_help=False)
+
+    command = commands.add_parser('analyze', help='print the insights of twitter_archive_master.csv')
+    command.add_argument('--master', default=MASTER_PATH)
+    command.add_argument('--chunksize', type=int, default=100000)
+    command.add_argument('--replicates', type=int, default=1000, help='bootstrap replicates of the correlation')
+    command.add_argument('--seed', type=int, default=0)
+    command.add_argument('--min-rows', type=int, default=16, help='breeds with fewer tweets are left out')
+
+    commands.add_parser('plot', help='render the insight plots, takes the options of plotting.py', add_help=False)
+
+    #merge and plot hand their options over to pipeline.py and plotting.py
+    args, options = parser.parse_known_args(argv)
+    if args.command == 'merge':
+        merge(options)
+    elif args.command == 'plot':
+        plot(options)
+    elif options:
+        parser.error('unrecognized arguments: {}'.format(' '.join(options)))
+    else:
+        {'gather': gather, 'enrich': enrich, 'clean': clean, 'analyze': analyze}[args.command](args)
+
+
+if __name__ == '__main__':
+    main()
@@ -7,10 +7,12 @@
 
 
 import pandas as pd
-import numpy as np
-import requests 
-import matplotlib.pyplot as plt 
-import seaborn as sb
+
+from analysis import Aggregates, Correlation
+from cleaning import (TimeIndex, apply_corrections, archive_plan, dog_stage, first_urls, load_corrections,
+                      merge_master, normalize_source, parse_timestamps, rating_conflicts, resolve_breed,
+                      retweet_links, stage_conflicts)
+from gathering import fetch_image_predictions
 
 
 # ## Data Gathering
@@ -33,10 +35,9 @@ twitter_archive.head()
 
 #first save the url link
 url = "https://d17h27t6h515a5.cloudfront.net/topher/2017/August/599fd2ad_image-predictions/image-predictions.tsv"
-response = requests.get(url)
-with open('image_predictions.tsv', 'wb') as file:
-    file.write(response.content)
-image_predictions = pd.read_csv('image_predictions.tsv', sep='\t')
+#fetch() streams the file to disk and only downloads it again when it changed on the server (ETag/Last-Modified),
+#an interrupted download is resumed where it stopped.
+image_predictions = fetch_image_predictions('image_predictions.tsv', url)
 #View the first couple of lines in image_predictions data
 image_predictions.head()
 
@@ -117,6 +118,12 @@ for point in zip(tweet_id, text):
     print("tweet Id:{} \n text: {} \n ----------------".format(*point))
 
 
+#parse every n/d rating in the text of all tweets (not only the ones with a denominator higher than 10) and
+#list the tweets where the most plausible one differs from the stored rating_numerator/rating_denominator,
+#including decimal numerators like 13.5/10 that were captured as 5/10.
+rating_conflicts(twitter_archive)
+
+
 # - **Tweet Id**  832088576586297345: This tweet needs to be deleted, no rating provided.
 # - **Tweet Id**  820690176645140481: Wrong rating provided, needs to be deleted.
 # - **Tweet Id**  775096608509886464: I've noticed that this a retweeted tweet for tweet with index **740373189193256964**, need to delete all retweeted tweets since its a duplicate ones.
@@ -293,8 +300,9 @@ image_predictions_clean= image_predictions.copy()
 # In[19]:
 
 
-#converting datatype to datetime
-twitter_archive_clean['timestamp'] = pd.to_datetime(twitter_archive_clean['timestamp'])
+#converting datatype to datetime, tz-aware UTC. parse_timestamps() reads the '2017-08-01 16:23:56 +0000' layout
+#directly instead of inferring the format
+twitter_archive_clean['timestamp'] = parse_timestamps(twitter_archive_clean['timestamp'])
 
 
 # #### Test
@@ -343,8 +351,11 @@ twitter_archive_clean.dtypes
 # In[23]:
 
 
+#link every retweet to its original before dropping it, original_in_archive tells if the original is kept
+retweets = retweet_links(twitter_archive_clean)
 #cleaning the retweeted tweets by selecting rows that have null in reteeted_status_user_id column
 twitter_archive_clean = twitter_archive_clean[pd.isnull(twitter_archive_clean['retweeted_status_user_id'])]
+retweets['original_in_archive'].value_counts()
 
 
 # #### Test
@@ -375,11 +386,9 @@ twitter_archive_clean.source.value_counts()
 # In[26]:
 
 
-#by using the method loc to change the value of certain column if a condition is met.
-twitter_archive_clean.loc[twitter_archive_clean['source'].str.contains('iPhone') , 'source'] = 'Twitter for iPhone'
-twitter_archive_clean.loc[twitter_archive_clean['source'].str.contains('Vine') , 'source'] = 'Vine'
-twitter_archive_clean.loc[twitter_archive_clean['source'].str.contains('Web') , 'source'] = 'Twitter for Web'
-twitter_archive_clean.loc[twitter_archive_clean['source'].str.contains('TweetDeck') , 'source'] = 'TweetDeck'
+#change the value of the source column to the client name of its <a href=...> tag (iPhone, Vine, Web, TweetDeck, or
+#the tag's own text for any other client). Each distinct value is parsed once, the result is a categorical column.
+twitter_archive_clean['source'] = normalize_source(twitter_archive_clean['source'])
 
 
 # #### Test
@@ -424,29 +433,14 @@ twitter_archive_clean.source.value_counts()
 # In[28]:
 
 
-#fixing the remaining row manually: -
-#first delete the rows with wrong ratings
-id_list=[832088576586297345, 820690176645140481, 758467244762497024, 731156023742988288, 713900603437621249, 
-         709198395643068416, 704054845121142784, 697463031882764288, 686035780142297088, 684225744407494656, 
-         684222868335505415, 682808988178739200, 677716515794329600, 675853064436391936]
-for i in id_list:
-    twitter_archive_clean=twitter_archive_clean.query('tweet_id !="{}"'.format(i))
-    
-#Now fix recrods that caputred wrong data: -
-twitter_archive_clean.loc[twitter_archive_clean['tweet_id'] =='740373189193256964', 'rating_numerator'] = 14
-twitter_archive_clean.loc[twitter_archive_clean['tweet_id'] =='740373189193256964', 'rating_denominator'] = 10
-
-twitter_archive_clean.loc[twitter_archive_clean['tweet_id'] =='722974582966214656', 'rating_numerator'] = 13
-twitter_archive_clean.loc[twitter_archive_clean['tweet_id'] =='722974582966214656', 'rating_denominator'] = 10
-
-twitter_archive_clean.loc[twitter_archive_clean['tweet_id'] =='716439118184652801', 'rating_numerator'] = 11
-twitter_archive_clean.loc[twitter_archive_clean['tweet_id'] =='716439118184652801', 'rating_denominator'] = 10
+#the deletions and fixes listed above are kept in the correction table rating_corrections.csv
+#(tweet_id, action, rating_numerator, rating_denominator, note), one row per tweet.
+#apply_corrections() drops the 'delete' rows and overrides the ratings of the 'fix' rows in one pass.
+corrections = load_corrections('rating_corrections.csv')
+twitter_archive_clean, corrections_report = apply_corrections(twitter_archive_clean, corrections)
 
-twitter_archive_clean.loc[twitter_archive_clean['tweet_id'] =='710658690886586372', 'rating_numerator'] = 10
-twitter_archive_clean.loc[twitter_archive_clean['tweet_id'] =='710658690886586372', 'rating_denominator'] = 10
-
-twitter_archive_clean.loc[twitter_archive_clean['tweet_id'] =='682962037429899265', 'rating_numerator'] = 10
-twitter_archive_clean.loc[twitter_archive_clean['tweet_id'] =='682962037429899265', 'rating_denominator'] = 10
+#number of rows matched by each correction
+corrections_report
 
 
 # #### Test
@@ -470,25 +464,13 @@ len(twitter_archive_clean.query('rating_denominator > 10'))
 # In[30]:
 
 
-#create a method that set the value of column 'dog_stage' based on the velue of doggo, floofer, pupper, and puppo columns
-def stage(row):
-    #if doggo has the value 'doggo', dog_stage column for this row is 'doggo'
-    if row['doggo'] == 'doggo':
-        val = 'doggo'
-    #if floofer has the value 'doggo', dog_stage column for this row is 'floofer'
-    elif row['floofer'] == 'floofer':
-        val = 'floofer'
-    #if pupper has the value 'doggo', dog_stage column for this row is 'pupper'
-    elif row['pupper'] == 'pupper':
-        val = 'pupper'
-    #if pippo has the value 'doggo', dog_stage column for this row is 'puppo'
-    elif row['puppo']=='puppo':
-        val = 'puppo'
-    #if all none, then the value for it is None
-    else:
-        val = None
-    return val
-twitter_archive_clean['dog_stage'] = twitter_archive_clean.apply(stage, axis=1)
+#set the value of column 'dog_stage' based on the value of doggo, floofer, pupper, and puppo columns.
+#dog_stage() works on the four columns at once instead of calling a method per row, and keeps the
+#same precedence: doggo > floofer > pupper > puppo. The result is a Categorical.
+twitter_archive_clean['dog_stage'] = dog_stage(twitter_archive_clean)
+
+#tweets that have more than one stage set, only the first one (by precedence) is kept in dog_stage
+stage_conflicts(twitter_archive_clean)
 
 
 # #### Test
@@ -527,6 +509,16 @@ twitter_archive_clean= twitter_archive_clean.drop(['in_reply_to_status_id', 'in_
 twitter_archive_clean.info()
 
 
+# In[ ]:
+
+
+#the cells of Issues #1-#7 as one cleaning plan, the way pipeline.py runs them: the optimizer leaves out the
+#columns that are only dropped, so they are not even read, and every step only copies the columns it uses
+archive_cleaning = archive_plan(corrections).optimize(twitter_archive.columns)
+archive_cleaning.execute(twitter_archive)
+print(archive_cleaning.explain())
+
+
 # ------------------------
 # ## Cleaning 2 ||  image_predictions dataset
 
@@ -547,7 +539,8 @@ twitter_archive_clean.info()
 # In[34]:
 
 
-image_predictions_clean= image_predictions_clean.drop_duplicates(subset='jpg_url', keep="first")
+#keep the first row of every jpg_url, compared by 64-bit hash instead of the url strings
+image_predictions_clean= image_predictions_clean[first_urls(image_predictions_clean['jpg_url'])]
 image_predictions_clean.head(3)
 
 
@@ -601,20 +594,10 @@ image_predictions_clean.head(4)
 
 #I'm only seeing if Pn_dog since the predictions is arranged from the strongest by (pn_conf), so checking if p1_dog is True without
 #checking the Pn_dog is enough.
-def extract_breed (row):
-    breed=''
-    if row['p1_dog']==True :
-        breed=row['p1']
-    elif row['p2_dog']==True : 
-         breed=row['p2']
-    elif row['p3_dog']==True :
-        breed=row['p3']
-    else:
-        breed= None
-
-    return breed
-#now I'm calling the function to create the new column: -
-image_predictions_clean['breed_of_dog']= image_predictions_clean.apply (lambda row: extract_breed(row), axis=1) 
+#resolve_breed() does this for all rows at once and also keeps the confidence of the picked prediction (breed_conf).
+breeds = resolve_breed(image_predictions_clean)
+image_predictions_clean['breed_of_dog'] = breeds['breed_of_dog']
+image_predictions_clean['breed_conf'] = breeds['breed_conf']
 #drop the the p1,p1_dog,p2_conf....etc 
 
 image_predictions_clean= image_predictions_clean.drop(['p1', 'p1_conf','p1_dog','p2','p2_conf',
@@ -699,24 +682,27 @@ tweet_json_clean.dtypes
 # In[46]:
 
 
-#create a new dataframe by using method 'merge' to merge two dataset 
-twitter_archive_master = pd.merge(twitter_archive_clean, 
-                      image_predictions_clean, 
-                      how = 'left', on = ['tweet_id'])
+#create a new dataframe by joining the three dataset on tweet_id.
+#merge_master() looks every tweet_id of the archive up in an index of image_predictions_clean and tweet_json_clean
+#and does both left joins in one pass, instead of two pd.merge calls.
+twitter_archive_master = merge_master(twitter_archive_clean, image_predictions_clean, tweet_json_clean)
+#the rows of the master sorted by timestamp, built once so a time-range query is two binary searches
+master_times = TimeIndex(twitter_archive_master['timestamp'])
 
 
-# In[47]:
+# In[48]:
 
 
-twitter_archive_master = pd.merge(twitter_archive_master, tweet_json_clean, 
-                      how = 'left', on = ['tweet_id'])
+#check the new dataframe
+twitter_archive_master.info()
 
 
-# In[48]:
+# In[ ]:
 
 
-#check the new dataframe
-twitter_archive_master.info()
+#retweets and favorites of the tweets of the first half of 2017, found with the time index
+first_half = master_times.slice(twitter_archive_master, '2017-01-01', '2017-07-01')
+first_half[['retweet_count', 'favorite_count']].describe()
 
 
 # ## Analyzing and Visualizing Data
@@ -727,8 +713,13 @@ twitter_archive_master.info()
 # In[49]:
 
 
+#count, sum, mean and variance of retweet_count, favorite_count and rating_numerator per breed, dog stage and
+#source, computed in one pass for all the insights below.
+aggregates = Aggregates.from_frame(twitter_archive_master)
+breeds = aggregates.table('breed_of_dog')
+
 #calculate the average retweet_count for each type of breeds of dogs.
-the_data = twitter_archive_master.groupby('breed_of_dog')['retweet_count'].mean().sort_values()
+the_data = breeds['retweet_count']['mean'].sort_values()
 the_data
 
 
@@ -742,7 +733,7 @@ the_data
 
 
 #Calculate the average favorite_count for each type of breeds of dogs.
-the_data2 = twitter_archive_master.groupby('breed_of_dog')['favorite_count'].mean().sort_values()
+the_data2 = breeds['favorite_count']['mean'].sort_values()
 the_data2
 
 
@@ -756,7 +747,10 @@ the_data2
 
 
 #calculate the correlation coeffecint between retweet_count and favorite_retweet.
-r = np.corrcoef(twitter_archive_master['retweet_count'], twitter_archive_master['favorite_count'])
+#the tweets missing from tweet_json have no counts after the left join, Correlation skips them. It also gives
+#the least-squares line and 95% bootstrap intervals of both.
+r = Correlation.from_columns(twitter_archive_master['retweet_count'], twitter_archive_master['favorite_count'],
+                             replicates=1000, seed=0).summary()
 #show it in the console
 r
 
@@ -764,6 +758,11 @@ r
 # In[52]:
 
 
+#the plotting libraries are imported here, where the visualizations start, so the gathering and
+#cleaning cells run without them
+import matplotlib.pyplot as plt
+import seaborn as sb
+
 #regplot method is used to plot data and a linear regression model fit,,
 #There are a number of mutually exclusive options for estimating the regression model. source(geeksforgeeks)
 sb.regplot(x="retweet_count", y="favorite_count", data=twitter_archive_master)
@@ -777,7 +776,7 @@ sb.regplot(x="retweet_count", y="favorite_count", data=twitter_archive_master)
 
 
 #plotting the distribution of source of tweets.
-plot = twitter_archive_master.source.value_counts().plot.pie(figsize=(7, 7),autopct='%.f%%', shadow=True)
+plot = aggregates.table('source')['rows']['count'].sort_values(ascending=False).plot.pie(figsize=(7, 7),autopct='%.f%%', shadow=True)
 plot.set_title('ditribution of source')
 
 
@@ -789,7 +788,7 @@ plot.set_title('ditribution of source')
 
 
 #plot the distribution of dog_stage in this dataset.
-plot2 = twitter_archive_master.dog_stage.value_counts().plot.pie(figsize=(7, 7),autopct='%.f%%', shadow=True)
+plot2 = aggregates.table('dog_stage')['rows']['count'].sort_values(ascending=False).plot.pie(figsize=(7, 7),autopct='%.f%%', shadow=True)
 plot2.set_title('ditribution of the dog stage')
 
 
@@ -801,7 +800,7 @@ plot2.set_title('ditribution of the dog stage')
 
 
 #calculate the average of rating numerator for each type of breeds of dogs.
-breeds_of_dog = twitter_archive_master.groupby(['breed_of_dog'])['rating_numerator'].mean().plot(kind='bar', figsize=(10,6),                                                                                                   color="indigo", fontsize=13);
+breeds_of_dog = breeds['rating_numerator']['mean'].plot(kind='bar', figsize=(10,6),                                                                                                   color="indigo", fontsize=13);
 
 #set the labels and title
 breeds_of_dog.set_title("The Average rating numerator for breeds of dogs", fontsize=15)
@@ -815,25 +814,24 @@ plt.show()
 
 
 #calculate the average count for each breed of dogs
-twitter_archive_master['breed_of_dog'].value_counts().mean()
+breeds['rows']['count'].mean()
 
 
 # In[64]:
 
 
-#source of filter method 'https://stackoverflow.com/questions/13167391/filtering-grouped-dataframe-in-pandas'
 #take only breeds that have more than 15 records
-filtered_breed = twitter_archive_master.groupby(['breed_of_dog']).filter(lambda x: len(x) > 15)
+filtered_breed = aggregates.table('breed_of_dog', min_rows=16)['rating_numerator']
 
 #plot the average rating for each breed.
-xx= filtered_breed.groupby(['breed_of_dog'])['rating_numerator'].mean().plot(kind='bar', figsize=(10,4), color="indigo", fontsize=8);
+xx= filtered_breed['mean'].plot(kind='bar', figsize=(10,4), color="indigo", fontsize=8);
 
 #set the labels and title
 xx.set_title("The Average rating numerator for breeds of dogs", fontsize=10)
 xx.set_ylabel("Average rating numerator", fontsize=10);
 
 #calculate the average of rating for filtered_breed 
-mean_rating= filtered_breed['rating_numerator'].mean()
+mean_rating= filtered_breed['sum'].sum() / filtered_breed['count'].sum()
 
 #plot a red line that represent the average rating for all breeds of dogs 
 plt.axhline(mean_rating, color="r");